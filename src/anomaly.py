@@ -1,26 +1,175 @@
 from __future__ import annotations
 
+import datetime as dt
+import json
+import math
+import os
+import pathlib
+from bisect import bisect_left, insort
+from collections.abc import Iterable
+from typing import Any
+
 import numpy as np
+import pandas as pd
+
+# days of history needed before a norm is reported
+MIN_HISTORY = 14
+# deviation from the norm that is flagged
+THRESHOLD = 0.35
 
 
 def compute_norm(values: list[float]) -> float | None:
     arr = np.array([v for v in values if v is not None])
     arr = arr[~np.isnan(arr)]
-    if len(arr) < 14:
+    if len(arr) < MIN_HISTORY:
         return None
     return float(np.median(arr))
 
 
-def classify(value: float | None, history: list[float]) -> tuple[str, float | None]:
-    """Return ('green'|'red'|'none', norm) according to ±35% around median norm."""
-    if value is None or (isinstance(value, float) and np.isnan(value)):
-        return ("none", None)
-    norm = compute_norm(history)
+def _flag(value: float, norm: float | None) -> tuple[str, float | None]:
     if norm is None or norm == 0:
         return ("none", norm)
     delta = (value - norm) / norm
-    if delta > 0.35:
+    if delta > THRESHOLD:
         return ("green", norm)
-    if delta < -0.35:
+    if delta < -THRESHOLD:
         return ("red", norm)
     return ("none", norm)
+
+
+def classify(value: float | None, history: list[float]) -> tuple[str, float | None]:
+    """Return ('green'|'red'|'none', norm) according to ±35% around median norm."""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ("none", None)
+    return _flag(value, compute_norm(history))
+
+
+def classify_matrix(
+    values: np.ndarray, min_history: int = MIN_HISTORY, threshold: float = THRESHOLD
+) -> tuple[np.ndarray, np.ndarray]:
+    """Classify a whole dates x metrics matrix (oldest date first, NaN for N/A) at once.
+
+    The norm of each cell is the median of the non-NaN values above it in its column
+    (expanding window over prior dates, at least `min_history` of them). Returns the
+    flag matrix ('green'|'red'|'none') and the norm matrix (NaN where `classify`
+    would report no norm), matching `classify` cell by cell.
+    """
+    frame = pd.DataFrame(np.asarray(values, dtype=float))
+    norms = frame.shift(1).expanding(min_periods=min_history).median().to_numpy(copy=True)
+    vals = frame.to_numpy()
+    norms[np.isnan(vals)] = np.nan
+    with np.errstate(divide="ignore", invalid="ignore"):
+        delta = (vals - norms) / norms
+    valid = ~np.isnan(norms) & (norms != 0)
+    flags = np.full(vals.shape, "none", dtype="<U5")
+    flags[valid & (delta > threshold)] = "green"
+    flags[valid & (delta < -threshold)] = "red"
+    return flags, norms
+
+
+def _as_number(value: Any) -> float | None:
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(number) else number
+
+
+class NormEngine:
+    """Incremental median norms per metric, persisted between runs.
+
+    Per metric it keeps the values by date plus a sorted value array and a sorted
+    date array. A day's value is inserted or replaced with bisect; the norm for a
+    date (median of all earlier days) is read from the sorted array by rank,
+    skipping the few values dated on or after that date, so a nightly lookup costs
+    O(log n) instead of re-sorting the whole history.
+    """
+
+    def __init__(self, path: str | os.PathLike[str]):
+        self.path = pathlib.Path(path)
+        self._values: dict[str, dict[str, float]] = {}
+        self._sorted: dict[str, list[float]] = {}
+        self._dates: dict[str, list[str]] = {}
+        if self.path.exists():
+            data = json.loads(self.path.read_text(encoding="utf-8") or "{}")
+            self._values = data.get("metrics") or {}
+
+    def is_empty(self) -> bool:
+        return not self._values
+
+    def _index(self, metric: str) -> tuple[dict[str, float], list[float], list[str]]:
+        by_date = self._values.setdefault(metric, {})
+        if metric not in self._sorted:
+            # built once per run from the persisted values
+            self._sorted[metric] = sorted(by_date.values())
+            self._dates[metric] = sorted(by_date)
+        return by_date, self._sorted[metric], self._dates[metric]
+
+    def set(self, metric: str, date: dt.date, value: Any) -> None:
+        """Insert or replace the value of a day; non-numeric values (N/A) remove it."""
+        by_date, arr, dates = self._index(metric)
+        key = date.isoformat()
+        old = by_date.pop(key, None)
+        if old is not None:
+            del arr[bisect_left(arr, old)]
+            del dates[bisect_left(dates, key)]
+        number = _as_number(value)
+        if number is not None:
+            by_date[key] = number
+            insort(arr, number)
+            insort(dates, key)
+
+    def update(self, date: dt.date, values: dict[str, Any]) -> None:
+        for metric, value in values.items():
+            if metric not in ("datum", "notizen"):
+                self.set(metric, date, value)
+
+    def seed(self, rows: Iterable[tuple[str, dt.date, Any]]) -> None:
+        """Load (metric, date, value) rows, e.g. from the metric store on the first run."""
+        for metric, date, value in rows:
+            number = _as_number(value)
+            if number is not None:
+                self._values.setdefault(metric, {})[date.isoformat()] = number
+        # sorted arrays are rebuilt lazily from the values
+        self._sorted.clear()
+        self._dates.clear()
+
+    def norm(self, metric: str, before: dt.date) -> float | None:
+        """Median of the metric over all days before `before`, None below MIN_HISTORY days."""
+        by_date, arr, dates = self._index(metric)
+        # values dated on/after `before` (none for the newest day, a few while re-harvesting)
+        later = sorted(by_date[d] for d in dates[bisect_left(dates, before.isoformat()) :])
+        n = len(arr) - len(later)
+        if n < MIN_HISTORY:
+            return None
+        skip = []
+        prev, dup = None, 0
+        for v in later:
+            dup = dup + 1 if v == prev else 0
+            skip.append(bisect_left(arr, v) + dup)
+            prev = v
+
+        def select(rank: int) -> float:
+            i = rank
+            for p in skip:
+                if p > i:
+                    break
+                i += 1
+            return arr[i]
+
+        return (select((n - 1) // 2) + select(n // 2)) / 2
+
+    def classify(self, metric: str, date: dt.date, value: Any) -> tuple[str, float | None]:
+        """Like `classify`, with the norm taken from the days before `date`."""
+        number = _as_number(value)
+        if number is None:
+            return ("none", None)
+        return _flag(number, self.norm(metric, date))
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(json.dumps({"metrics": self._values}), encoding="utf-8")
+        os.replace(tmp, self.path)
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import json
-from typing import Any
+from typing import Any, Literal
 
 from pydantic import Field, field_validator
 from pydantic_settings import BaseSettings
@@ -51,14 +51,42 @@ class Settings(BaseSettings):
     RUN_HOUR: int = 3
     RUN_MINUTE: int = 30
     BACKFILL_DAYS: int = 90
+    # Days after which a date's values are considered final (e.g. Google Ads conversion lag)
+    HARVEST_SETTLING_DAYS: int = 3
+    STATE_DIR: str = "state"
+
+    # Sources/accounts fetched in parallel per date, with per-provider caps
+    # (keys: shopware6, getmyinvoices, google_ads, amazon, ebay, tiktok)
+    FETCH_MAX_WORKERS: int = 8
+    FETCH_CONCURRENCY: dict[str, int] = Field(default_factory=lambda: {"amazon": 2})
+    # "threads" (one date at a time) or "asyncio" (all planned dates on one event loop)
+    FETCH_ENGINE: Literal["threads", "asyncio"] = "threads"
+    # Sources with a range mode fetch a whole window at once for runs of this many
+    # consecutive due dates
+    RANGE_MIN_DAYS: int = 2
+    # Max in-flight requests per API host for the asyncio engine
+    HTTP_MAX_PER_HOST: int = 8
+    # Keep-alive connections pooled per API host (requests and httpx)
+    HTTP_POOL_SIZE: int = 10
+    # Raw API responses cached under STATE_DIR/responses (disk budget in MB, 0 = off),
+    # TTL in seconds per source; replay re-aggregates all dates from the cache only
+    RESPONSE_CACHE_MAX_MB: int = 512
+    RESPONSE_CACHE_TTL: dict[str, int] = Field(default_factory=lambda: {"getmyinvoices": 3600})
+    RESPONSE_CACHE_REPLAY: bool = False
 
     GOOGLE_SPREADSHEET_ID: str
     GOOGLE_SHEET_TAB: str = "Tägliche Kennzahlen"
     GOOGLE_SERVICE_ACCOUNT_JSON: str | None = None
     GOOGLE_SERVICE_ACCOUNT_FILE: str | None = None
+    # Rows staged before they are written in one batch update
+    SHEETS_FLUSH_ROWS: int = 30
+    # Sheets API requests per sliding minute (quota: 60 per user)
+    SHEETS_REQUESTS_PER_MINUTE: int = 60
 
     OPENAI_API_KEY: str
     OPENAI_MODEL: str = "gpt-5-nano"
+    # Notes generated concurrently in the background (cached in STATE_DIR/notes.json)
+    OPENAI_MAX_CONCURRENCY: int = 4
 
     ALERT_EMAIL_TO: str | None = None
     ALERT_EMAIL_FROM: str | None = None
@@ -104,15 +132,22 @@ class Settings(BaseSettings):
             return json.loads(v)
         return v
 
+    @field_validator("TIKTOK_SHOPS", mode="before")
+    @classmethod
+    def parse_tiktok(cls, v: Any):
+        if isinstance(v, str):
+            return json.loads(v)
+        return v
+
+    @field_validator("FETCH_CONCURRENCY", "RESPONSE_CACHE_TTL", mode="before")
+    @classmethod
+    def parse_json_mapping(cls, v: Any):
+        if isinstance(v, str):
+            return json.loads(v)
+        return v
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
         case_sensitive = False
 
-
-@field_validator("TIKTOK_SHOPS", mode="before")
-@classmethod
-def parse_tiktok(cls, v: Any):
-    if isinstance(v, str):
-        return json.loads(v)
-    return v
@@ -1,10 +1,23 @@
 from __future__ import annotations
 
+import csv
 import datetime as dt
+import gzip
+import io
 import logging
+import time
+from collections.abc import Iterator
+from functools import partial
+from typing import IO, Any
 
-from sp_api.api import Finances, Orders
-from sp_api.base import Marketplaces
+from sp_api.api import Finances, Orders, Reports
+from sp_api.base import ApiResponse, Marketplaces
+from sp_api.base.exceptions import SellingApiRequestThrottledException
+
+from .. import response_cache
+from ..util.datewin import dates_in_range
+from ..util.http_pool import session_for
+from ..util.rate_limit import RateScheduler
 
 REGION_TO_MARKETPLACE = {
     "eu": Marketplaces.DE,
@@ -47,69 +60,337 @@ def _finances_client(
     )
 
 
+def _reports_client(
+    region: str,
+    refresh_token: str,
+    lwa_client_id: str,
+    lwa_client_secret: str,
+    role_arn: str,
+):
+    mp = REGION_TO_MARKETPLACE.get(region, Marketplaces.DE)
+    return Reports(
+        refresh_token=refresh_token,
+        lwa_app_id=lwa_client_id,
+        lwa_client_secret=lwa_client_secret,
+        role_arn=role_arn,
+        marketplace=mp,
+    )
+
+
 log = logging.getLogger(__name__)
 
+ORDERS_REPORT_TYPE = "GET_FLAT_FILE_ALL_ORDERS_DATA_BY_ORDER_DATE_GENERAL"
+REPORT_POLL_SECONDS = 30
+REPORT_TIMEOUT_SECONDS = 1800
+# flat-file columns that make up the order total, per item line
+REPORT_AMOUNT_COLUMNS = ("item-price", "shipping-price", "gift-wrap-price")
+REPORT_DISCOUNT_COLUMNS = ("item-promotion-discount", "ship-promotion-discount")
+GZIP_MAGIC = b"\x1f\x8b"
 
-def fetch_amazon_daily(account: dict, date: dt.date) -> dict[str, float]:
-    name = account["name"]
-    region = account["region"]
-    refresh_token = account["refresh_token"]
-    lwa_client_id = account["lwa_client_id"]
-    lwa_client_secret = account["lwa_client_secret"]
-    role_arn = account["role_arn"]
+# documented SP-API usage plans: operation -> (requests per second, burst)
+SP_API_RATES: dict[str, tuple[float, float]] = {
+    "getOrders": (0.0167, 20),
+    "listFinancialEvents": (0.5, 30),
+    "createReport": (0.0167, 15),
+    "getReport": (2.0, 15),
+    "getReportDocument": (0.0167, 15),
+}
+THROTTLE_RETRIES = 5
+# read-only operations whose raw payloads go through the response cache
+# (financial events are cached as raw RefundEventList pages, see `_refund_charges`)
+CACHED_OPERATIONS = {"getOrders"}
+
+# one bucket per (account, region, operation), shared by all threads of the process
+_scheduler = RateScheduler()
+
+
+def _call(account: dict, operation: str, fn, *args, **kwargs):
+    """Call an SP-API operation paced by its token bucket.
+
+    The bucket rate follows the x-amzn-RateLimit-Limit header; throttled (429) calls
+    drain the bucket and are retried after its refill time.
+    """
+    rate, burst = SP_API_RATES[operation]
+    bucket = _scheduler.bucket((account["name"], account["region"], operation), rate, burst)
+    for attempt in range(THROTTLE_RETRIES + 1):
+        bucket.acquire()
+        try:
+            resp = fn(*args, **kwargs)
+        except SellingApiRequestThrottledException as e:
+            limit = (e.headers or {}).get("x-amzn-RateLimit-Limit")
+            if limit:
+                bucket.set_rate(float(limit))
+            if attempt == THROTTLE_RETRIES:
+                raise
+            log.warning("SP-API %s throttled for %s, retrying", operation, account["name"])
+            bucket.drain()
+            continue
+        if resp.rate_limit:
+            bucket.set_rate(float(resp.rate_limit))
+        return resp
+
+
+def _cached_call(account: dict, operation: str, fn, **kwargs) -> ApiResponse:
+    """`_call` for read-only operations, served from the response cache when possible."""
+    if operation not in CACHED_OPERATIONS:
+        return _call(account, operation, fn, **kwargs)
+    payload = response_cache.cached_json(
+        "amazon",
+        account["name"],
+        operation,
+        kwargs,
+        lambda: _call(account, operation, fn, **kwargs).payload,
+    )
+    return ApiResponse(payload=payload)
+
+
+def _credentials(account: dict) -> tuple[str, str, str, str, str]:
+    return (
+        account["region"],
+        account["refresh_token"],
+        account["lwa_client_id"],
+        account["lwa_client_secret"],
+        account["role_arn"],
+    )
+
+
+def _sum_orders(account: dict, orders_client, start: str, end: str) -> float:
+    # Sales via Orders API (OrderTotal)
+    total_sales = 0.0
+    token = None
+    while True:
+        resp = _cached_call(
+            account,
+            "getOrders",
+            orders_client.get_orders,
+            CreatedAfter=start,
+            CreatedBefore=end,
+            NextToken=token,
+        )
+        for o in resp.payload.get("Orders", []):
+            t = o.get("OrderTotal") or {}
+            if t.get("CurrencyCode") == "EUR":
+                total_sales += float(t.get("Amount") or 0.0)
+        token = resp.payload.get("NextToken")
+        if not token:
+            break
+    return total_sales
+
+
+def _day_bounds(date: dt.date) -> tuple[str, str]:
     start = dt.datetime(date.year, date.month, date.day, 0, 0, 0).isoformat()
     end = (dt.datetime(date.year, date.month, date.day) + dt.timedelta(days=1)).isoformat()
+    return start, end
+
+
+def _utc_day(value: str) -> dt.date:
+    # getOrders/financial-event windows are naive ISO strings, i.e. UTC; bucket the same way
+    moment = dt.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(dt.timezone.utc)
+    return moment.date()
+
+
+def _refund_charges(
+    account: dict, finances_client, start: str, end: str
+) -> Iterator[tuple[dt.date | None, float]]:
+    """Yield compact (posted day, EUR amount) pairs for all refund charges in [start, end).
+
+    One paginated stream over the whole window. Only the raw RefundEventList of each
+    page (plus the next-page token) goes to the response cache; parsing happens after
+    the cache, so a replay re-applies the current refund logic.
+    """
+
+    def _page(token: str | None) -> dict[str, Any]:
+        payload = _call(
+            account,
+            "listFinancialEvents",
+            finances_client.list_financial_events,
+            PostedAfter=start,
+            PostedBefore=end,
+            MaxResultsPerPage=100,
+            NextToken=token,
+        ).payload
+        events = (payload.get("FinancialEvents") or {}).get("RefundEventList") or []
+        return {"RefundEventList": events, "NextToken": payload.get("NextToken")}
+
+    token = None
+    while True:
+        params = {"PostedAfter": start, "PostedBefore": end, "NextToken": token}
+        page = response_cache.cached_json(
+            "amazon",
+            account["name"],
+            "listFinancialEvents:RefundEventList",
+            params,
+            partial(_page, token),
+        )
+        for e in page["RefundEventList"]:
+            day = _utc_day(e["PostedDate"]) if e.get("PostedDate") else None
+            for c in e.get("RefundChargeList") or []:
+                amount = c.get("ChargeAmount", {})
+                if amount.get("CurrencyCode") == "EUR":
+                    yield day, float(amount.get("CurrencyAmount") or 0.0)
+        token = page["NextToken"]
+        if not token:
+            break
+
+
+def _refunds_by_day(
+    account: dict, finances_client, first: dt.date, last: dt.date
+) -> dict[dt.date, float]:
+    # Returns via Finances Refund Events, bucketed by posted date
+    start, _ = _day_bounds(first)
+    _, end = _day_bounds(last)
+    totals = {d: 0.0 for d in dates_in_range(first, last)}
+    for day, amount in _refund_charges(account, finances_client, start, end):
+        if day is None and first == last:
+            # an event without PostedDate can only be placed in a single-day window
+            day = first
+        if day in totals:
+            totals[day] += amount
+    return totals
+
+
+def _wait_for_report(account: dict, reports_client, report_id: str) -> str | None:
+    """Poll until the report is done; returns its document id, or None if there was no data."""
+    deadline = time.monotonic() + REPORT_TIMEOUT_SECONDS
+    while True:
+        report = _call(account, "getReport", reports_client.get_report, report_id).payload
+        status = report.get("processingStatus")
+        if status == "DONE":
+            return report["reportDocumentId"]
+        if status == "CANCELLED":
+            # Amazon cancels reports that have no data to return
+            return None
+        if status == "FATAL":
+            raise RuntimeError(f"Amazon report {report_id} failed")
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Amazon report {report_id} not ready in time")
+        time.sleep(REPORT_POLL_SECONDS)
+
+
+def _download_document(document: dict, f: IO[bytes]) -> None:
+    # stream the report document to disk in chunks instead of downloading it into memory
+    url = document["url"]
+    with session_for(url).get(url, stream=True, timeout=120) as r:
+        r.raise_for_status()
+        for chunk in r.iter_content(chunk_size=1 << 16):
+            f.write(chunk)
+
+
+def _report_lines(f: IO[bytes]) -> Iterator[dict[str, str]]:
+    # parse the (optionally gzipped) TSV document row by row
+    raw: IO[bytes] = f
+    if f.peek(2)[:2] == GZIP_MAGIC:
+        raw = gzip.GzipFile(fileobj=f)
+    text = io.TextIOWrapper(raw, encoding="iso-8859-1")
+    yield from csv.DictReader(text, delimiter="\t")
+
+
+def _amount(line: dict[str, str], column: str) -> float:
+    try:
+        return float(line.get(column) or 0.0)
+    except ValueError:
+        return 0.0
+
+
+def _line_total(line: dict[str, str]) -> float:
+    total = sum(_amount(line, c) for c in REPORT_AMOUNT_COLUMNS)
+    return total - sum(abs(_amount(line, c)) for c in REPORT_DISCOUNT_COLUMNS)
+
+
+def _report_sales_by_day(
+    account: dict, reports_client, marketplace_id: str, first: dt.date, last: dt.date
+) -> dict[dt.date, float]:
+    start, _ = _day_bounds(first)
+    _, end = _day_bounds(last)
+
+    def _download(f: IO[bytes]) -> None:
+        report_id = _call(
+            account,
+            "createReport",
+            reports_client.create_report,
+            reportType=ORDERS_REPORT_TYPE,
+            dataStartTime=start,
+            dataEndTime=end,
+            marketplaceIds=[marketplace_id],
+        ).payload["reportId"]
+        document_id = _wait_for_report(account, reports_client, report_id)
+        if document_id is None:
+            # no data: an empty document
+            return
+        document = _call(
+            account, "getReportDocument", reports_client.get_report_document, document_id
+        ).payload
+        _download_document(document, f)
+
+    totals = {d: 0.0 for d in dates_in_range(first, last)}
+    params = {"start": start, "end": end, "marketplace_id": marketplace_id}
+    with response_cache.cached_file(
+        "amazon", account["name"], ORDERS_REPORT_TYPE, params, _download
+    ) as f:
+        for line in _report_lines(f):
+            if line.get("currency") != "EUR" or line.get("order-status") == "Cancelled":
+                continue
+            day = _utc_day(line["purchase-date"])
+            if day in totals:
+                totals[day] += _line_total(line)
+    return totals
+
+
+def fetch_amazon_range(
+    account: dict, first: dt.date, last: dt.date
+) -> dict[dt.date, dict[str, float | str]]:
+    """Per-date columns over [first, last]; sales come from one flat-file orders report
+    and refunds from one financial-events stream for the whole window, instead of
+    paging the heavily throttled getOrders and listFinancialEvents per day."""
+    name = account["name"]
+    creds = _credentials(account)
+    key_sales = f"amazon_{name}_umsatz_brutto_eur"
+    key_returns = f"amazon_{name}_retouren_eur"
+    days = dates_in_range(first, last)
+    out: dict[dt.date, dict[str, float | str]] = {
+        d: {key_sales: "N/A", key_returns: "N/A"} for d in days
+    }
+
+    try:
+        mp = REGION_TO_MARKETPLACE.get(account["region"], Marketplaces.DE)
+        sales = _report_sales_by_day(
+            account, _reports_client(*creds), mp.marketplace_id, first, last
+        )
+        for d in days:
+            out[d][key_sales] = round(sales[d], 2)
+    except Exception as e:
+        log.exception("Amazon orders report failed for %s: %s", name, e)
+
+    try:
+        refunds = _refunds_by_day(account, _finances_client(*creds), first, last)
+        for d in days:
+            out[d][key_returns] = round(abs(refunds[d]), 2)
+    except Exception as e:
+        log.exception("Amazon Finances fetch failed for %s: %s", name, e)
+
+    return out
+
+
+def fetch_amazon_daily(account: dict, date: dt.date) -> dict[str, float]:
+    name = account["name"]
+    creds = _credentials(account)
+    start, end = _day_bounds(date)
 
     key_sales = f"amazon_{name}_umsatz_brutto_eur"
     key_returns = f"amazon_{name}_retouren_eur"
 
     out: dict[str, float | str] = {key_sales: "N/A", key_returns: "N/A"}
 
-    # Sales via Orders API (OrderTotal)
     try:
-        orders_client = _orders_client(
-            region, refresh_token, lwa_client_id, lwa_client_secret, role_arn
-        )
-        total_sales = 0.0
-        token = None
-        while True:
-            resp = orders_client.get_orders(
-                CreatedAfter=start, CreatedBefore=end, NextToken=token
-            )
-            for o in resp.payload.get("Orders", []):
-                t = o.get("OrderTotal") or {}
-                if t.get("CurrencyCode") == "EUR":
-                    total_sales += float(t.get("Amount") or 0.0)
-            token = resp.payload.get("NextToken")
-            if not token:
-                break
-        out[key_sales] = round(total_sales, 2)
+        out[key_sales] = round(_sum_orders(account, _orders_client(*creds), start, end), 2)
     except Exception as e:
         log.exception("Amazon Orders fetch failed for %s: %s", name, e)
 
-    # Returns via Finances Refund Events (yesterday)
     try:
-        finances_client = _finances_client(
-            region, refresh_token, lwa_client_id, lwa_client_secret, role_arn
-        )
-        total_refunds = 0.0
-        token = None
-        while True:
-            resp = finances_client.list_financial_events(
-                PostedAfter=start, PostedBefore=end, NextToken=token
-            )
-            events = resp.payload.get("FinancialEvents", {})
-            refund_events = events.get("RefundEventList") or []
-            for e in refund_events:
-                charge = e.get("RefundChargeList") or []
-                for c in charge:
-                    amount = c.get("ChargeAmount", {})
-                    if amount.get("CurrencyCode") == "EUR":
-                        total_refunds += float(amount.get("CurrencyAmount") or 0.0)
-            token = resp.payload.get("NextToken")
-            if not token:
-                break
-        out[key_returns] = round(abs(total_refunds), 2)
+        refunds = _refunds_by_day(account, _finances_client(*creds), date, date)
+        out[key_returns] = round(abs(refunds[date]), 2)
     except Exception as e:
         log.exception("Amazon Finances fetch failed for %s: %s", name, e)
 
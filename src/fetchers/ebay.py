@@ -1,16 +1,29 @@
 from __future__ import annotations
 
+import asyncio
 import datetime as dt
-import time
+from collections.abc import Awaitable, Iterator
+from functools import partial
 
-import requests
 from tenacity import retry, stop_after_attempt, wait_exponential
 
+from .. import response_cache, token_cache
+from ..util.async_http import AsyncHttp, is_unauthorized
+from ..util.datewin import dates_in_range
+from ..util.http_pool import session_for
+
 ENV_URL = {
     "production": "https://apiz.ebay.com",
     "sandbox": "https://api.sandbox.ebay.com",
 }
 
+TOKEN_SCOPE = "https://api.ebay.com/oauth/api_scope/sell.fulfillment.readonly"
+TOKEN_PROVIDER = "ebay"
+# eBay user access tokens live two hours
+DEFAULT_TOKEN_TTL = 7200
+# maximum page size of getOrders
+PAGE_LIMIT = 200
+
 
 @retry(stop=stop_after_attempt(3), wait=wait_exponential(min=1, max=8))
 def _refresh_access_token(
@@ -19,49 +32,165 @@ def _refresh_access_token(
     cert_id: str,
     redirect_uri: str,
     refresh_token: str,
-) -> str:
+) -> tuple[str, float]:
     url = f"{base}/identity/v1/oauth2/token"
     data = {
         "grant_type": "refresh_token",
         "refresh_token": refresh_token,
-        "scope": "https://api.ebay.com/oauth/api_scope/sell.fulfillment.readonly",
+        "scope": TOKEN_SCOPE,
     }
-    r = requests.post(url, data=data, auth=(app_id, cert_id), timeout=30)
+    r = session_for(url).post(url, data=data, auth=(app_id, cert_id), timeout=30)
     r.raise_for_status()
-    return r.json()["access_token"]
+    data = r.json()
+    return data["access_token"], data.get("expires_in", DEFAULT_TOKEN_TTL)
 
 
-def fetch_ebay_daily(account: dict, date: dt.date) -> dict[str, float]:
-    base = ENV_URL.get(account["environment"], ENV_URL["production"])
-    access_token = _refresh_access_token(
-        base,
-        account["app_id"],
-        account["cert_id"],
-        account["redirect_uri"],
-        account["refresh_token"],
+def _access_token(account: dict, base: str) -> str:
+    return token_cache.get_or_refresh(
+        TOKEN_PROVIDER,
+        account["name"],
+        lambda: _refresh_access_token(
+            base,
+            account["app_id"],
+            account["cert_id"],
+            account["redirect_uri"],
+            account["refresh_token"],
+        ),
     )
-    # get orders created yesterday, sum total
-    start = dt.datetime(date.year, date.month, date.day, 0, 0, 0).isoformat() + "Z"
-    end = (dt.datetime(date.year, date.month, date.day) + dt.timedelta(days=1)).isoformat() + "Z"
-    url = f"{base}/sell/fulfillment/v1/order"
-    params = {"filter": f"creationdate:[{start}..{end})"}
-    headers = {
+
+
+def _order_filter(first: dt.date, last: dt.date | None = None) -> dict[str, str]:
+    # get orders created on first..last (inclusive), one filter for the whole window
+    last = last or first
+    start = dt.datetime(first.year, first.month, first.day, 0, 0, 0).isoformat() + "Z"
+    end = (dt.datetime(last.year, last.month, last.day) + dt.timedelta(days=1)).isoformat() + "Z"
+    return {"filter": f"creationdate:[{start}..{end})"}
+
+
+def _order_day(order: dict) -> dt.date | None:
+    # creationDate is UTC, like the filter bounds above
+    created = order.get("creationDate")
+    return dt.date.fromisoformat(created[:10]) if created else None
+
+
+def _api_headers(access_token: str) -> dict[str, str]:
+    return {
         "Authorization": f"Bearer {access_token}",
         "Content-Type": "application/json",
         "Accept": "application/json",
     }
+
+
+def _sum_orders(orders: list[dict]) -> float:
     total = 0.0
-    while True:
-        r = requests.get(url, headers=headers, params=params, timeout=30)
+    for o in orders:
+        t = o.get("pricingSummary", {}).get("total", {})
+        if t.get("currency") == "EUR":
+            total += float(t.get("value") or 0.0)
+    return total
+
+
+def _iter_orders(account: dict, params: dict[str, str]) -> Iterator[dict]:
+    """Yield all orders matching `params`, following `next` links with one access token."""
+    base = ENV_URL.get(account["environment"], ENV_URL["production"])
+    url = f"{base}/sell/fulfillment/v1/order"
+    params = {**params, "limit": PAGE_LIMIT}
+    headers: dict[str, str] | None = None
+
+    def _page(url: str, params: dict) -> dict:
+        # the token is only requested once a page is not served from the response cache
+        nonlocal headers
+        if headers is None:
+            headers = _api_headers(_access_token(account, base))
+        r = session_for(url).get(url, headers=headers, params=params, timeout=30)
+        if r.status_code == 401:
+            token_cache.invalidate(TOKEN_PROVIDER, account["name"])
+            headers = _api_headers(_access_token(account, base))
+            r = session_for(url).get(url, headers=headers, params=params, timeout=30)
         r.raise_for_status()
-        data = r.json()
-        for o in data.get("orders", []):
-            t = o.get("pricingSummary", {}).get("total", {})
-            if t.get("currency") == "EUR":
-                total += float(t.get("value") or 0.0)
+        return r.json()
+
+    while True:
+        data = response_cache.cached_json(
+            TOKEN_PROVIDER, account["name"], url, params, partial(_page, url, params)
+        )
+        yield from data.get("orders", [])
         nxt = data.get("next")
         if not nxt:
             break
         url = nxt
         params = {}
+
+
+def fetch_ebay_daily(account: dict, date: dt.date) -> dict[str, float]:
+    total = _sum_orders(list(_iter_orders(account, _order_filter(date))))
+    return {f"ebay_{account['name']}_umsatz_brutto_eur": round(total, 2)}
+
+
+def fetch_ebay_range(
+    account: dict, first: dt.date, last: dt.date
+) -> dict[dt.date, dict[str, float]]:
+    """Per-date sales over [first, last] from one paged order search for the whole window."""
+    by_day: dict[dt.date, list[dict]] = {d: [] for d in dates_in_range(first, last)}
+    for order in _iter_orders(account, _order_filter(first, last)):
+        day = _order_day(order)
+        if day in by_day:
+            by_day[day].append(order)
+    key = f"ebay_{account['name']}_umsatz_brutto_eur"
+    return {d: {key: round(_sum_orders(orders), 2)} for d, orders in by_day.items()}
+
+
+async def fetch_ebay_daily_async(account: dict, date: dt.date, http: AsyncHttp) -> dict[str, float]:
+    """asyncio variant of `fetch_ebay_daily`; pages after the first are fetched concurrently
+    via `offset`, using the `total` reported with the first page."""
+    base = ENV_URL.get(account["environment"], ENV_URL["production"])
+
+    async def _refresh() -> tuple[str, float]:
+        data = await http.post_json(
+            f"{base}/identity/v1/oauth2/token",
+            data={
+                "grant_type": "refresh_token",
+                "refresh_token": account["refresh_token"],
+                "scope": TOKEN_SCOPE,
+            },
+            auth=(account["app_id"], account["cert_id"]),
+            timeout=30,
+        )
+        return data["access_token"], data.get("expires_in", DEFAULT_TOKEN_TTL)
+
+    def _token() -> Awaitable[str]:
+        # one token call per account even when many dates run concurrently
+        return token_cache.aget_or_refresh(TOKEN_PROVIDER, account["name"], _refresh)
+
+    url = f"{base}/sell/fulfillment/v1/order"
+    params = {**_order_filter(date), "limit": PAGE_LIMIT}
+
+    async def _page(page_params: dict) -> dict:
+        async def _fetch() -> dict:
+            try:
+                headers = _api_headers(await _token())
+                return await http.get_json(url, headers=headers, params=page_params, timeout=30)
+            except Exception as e:
+                if not is_unauthorized(e):
+                    raise
+                token_cache.invalidate(TOKEN_PROVIDER, account["name"])
+                headers = _api_headers(await _token())
+                return await http.get_json(url, headers=headers, params=page_params, timeout=30)
+
+        return await response_cache.acached_json(
+            TOKEN_PROVIDER, account["name"], url, page_params, _fetch
+        )
+
+    first = await _page(params)
+    total = _sum_orders(first.get("orders", []))
+    limit = int(first.get("limit") or len(first.get("orders", [])) or 1)
+    count = int(first.get("total") or 0)
+    pages = await asyncio.gather(
+        *(
+            _page({**params, "limit": limit, "offset": offset})
+            for offset in range(limit, count, limit)
+        )
+    )
+    for data in pages:
+        total += _sum_orders(data.get("orders", []))
     return {f"ebay_{account['name']}_umsatz_brutto_eur": round(total, 2)}
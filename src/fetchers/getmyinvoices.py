@@ -1,42 +1,203 @@
 from __future__ import annotations
 
+import asyncio
 import datetime as dt
+import logging
+import threading
 
-import requests
 from tenacity import retry, stop_after_attempt, wait_exponential
 
+from .. import response_cache
+from ..util.async_http import AsyncHttp
+from ..util.datewin import dates_in_range
+from ..util.http_pool import session_for
+from ..util.pool import run_bounded
+
 BASE_URL = "https://api.getmyinvoices.com/api/v2"
+CACHE_SOURCE = "getmyinvoices"
+# one API key per deployment
+CACHE_ACCOUNT = "default"
+
+log = logging.getLogger(__name__)
+
+
+def _headers(api_key: str) -> dict[str, str]:
+    return {"Authorization": f"Bearer {api_key}"}
 
 
 @retry(stop=stop_after_attempt(3), wait=wait_exponential(min=1, max=8))
-def _get(path: str, api_key: str, params=None):
-    headers = {"Authorization": f"Bearer {api_key}"}
-    r = requests.get(f"{BASE_URL}{path}", headers=headers, params=params or {}, timeout=30)
+def _fetch(path: str, api_key: str, params=None):
+    r = session_for(BASE_URL).get(
+        f"{BASE_URL}{path}", headers=_headers(api_key), params=params or {}, timeout=30
+    )
     r.raise_for_status()
     return r.json()
 
 
-def fetch_gmi_bank_balances_eod(api_key: str, date: dt.date) -> dict[str, float]:
-    # 1) list accounts
-    data = _get("/bank-accounts", api_key)
-    accounts = data.get("data") or []
-    # 2) for each account, get EoD balance for date
+def _get(path: str, api_key: str, params=None):
+    return response_cache.cached_json(
+        CACHE_SOURCE, CACHE_ACCOUNT, path, params or {}, lambda: _fetch(path, api_key, params)
+    )
+
+
+async def _aget(http: AsyncHttp, path: str, api_key: str, params=None):
+    return await response_cache.acached_json(
+        CACHE_SOURCE,
+        CACHE_ACCOUNT,
+        path,
+        params or {},
+        lambda: http.get_json(
+            f"{BASE_URL}{path}", headers=_headers(api_key), params=params or {}, timeout=30
+        ),
+    )
+
+
+def _account_name(acc: dict) -> str:
+    return acc.get("name") or acc.get("iban") or acc.get("id")
+
+
+def _collect(balances: list[tuple[str, float | None]]) -> dict[str, float | str]:
     out: dict[str, float | str] = {}
     total = 0.0
-    for acc in accounts:
-        acc_id = acc.get("id")
-        name = acc.get("name") or acc.get("iban") or acc_id
+    for name, amount in balances:
+        if amount is None:
+            out[f"bank_{name}_kontostand_eur"] = "N/A"
+            continue
+        out[f"bank_{name}_kontostand_eur"] = round(amount, 2)
+        total += amount
+    out["bank_gesamt_kontostand_eur"] = round(total, 2) if total else "N/A"
+    return out
+
+
+def _eod_balances(history: list[dict], days: list[dt.date]) -> dict[dt.date, float | None]:
+    # last booked balance at or before each day; days before the first entry stay unknown
+    by_day: dict[dt.date, float] = {}
+    for entry in sorted(history, key=lambda e: e.get("date") or ""):
+        if entry.get("date") and entry.get("amount") is not None:
+            by_day[dt.date.fromisoformat(str(entry["date"])[:10])] = float(entry["amount"])
+    out: dict[dt.date, float | None] = {}
+    current: float | None = None
+    earlier = [d for d in by_day if d < days[0]]
+    if earlier:
+        current = by_day[max(earlier)]
+    for d in days:
+        current = by_day.get(d, current)
+        out[d] = current
+    return out
+
+
+class GetMyInvoicesClient:
+    """GetMyInvoices access for one run: the account list is fetched once and reused
+    across dates, balances are requested concurrently (at most `max_workers` at a time)."""
+
+    def __init__(self, api_key: str, max_workers: int = 8):
+        self.api_key = api_key
+        self.max_workers = max_workers
+        self._accounts: list[dict] | None = None
+        self._lock = threading.Lock()
+        # concurrent dates of the asyncio engine share one account-list request
+        self._async_lock = asyncio.Lock()
+
+    def accounts(self) -> list[dict]:
+        with self._lock:
+            if self._accounts is None:
+                self._accounts = _get("/bank-accounts", self.api_key).get("data") or []
+            return self._accounts
+
+    async def accounts_async(self, http: AsyncHttp) -> list[dict]:
+        async with self._async_lock:
+            if self._accounts is None:
+                data = await _aget(http, "/bank-accounts", self.api_key)
+                self._accounts = data.get("data") or []
+            return self._accounts
+
+    def balance(self, acc: dict, date: dt.date) -> float | None:
         # Hypothetical endpoint for balances history; adjust to actual GMI API if different.
         try:
             bal = _get(
-                f"/bank-accounts/{acc_id}/balances",
-                api_key,
+                f"/bank-accounts/{acc.get('id')}/balances",
+                self.api_key,
                 params={"date": date.isoformat()},
             )
-            amount = float(bal.get("data", {}).get("amount"))
-            out[f"bank_{name}_kontostand_eur"] = round(amount, 2)
-            total += amount
+            return float(bal.get("data", {}).get("amount"))
         except Exception:
-            out[f"bank_{name}_kontostand_eur"] = "N/A"
-    out["bank_gesamt_kontostand_eur"] = round(total, 2) if total else "N/A"
-    return out
+            return None
+
+    def balance_history(
+        self, acc: dict, first: dt.date, last: dt.date
+    ) -> dict[dt.date, float | None]:
+        """EoD balance per day from one history request over [first, last].
+
+        Falls back to one request per day if the API does not return a history list.
+        """
+        days = dates_in_range(first, last)
+        try:
+            data = _get(
+                f"/bank-accounts/{acc.get('id')}/balances",
+                self.api_key,
+                params={"from": first.isoformat(), "to": last.isoformat()},
+            ).get("data")
+        except Exception:
+            data = None
+        if not isinstance(data, list):
+            log.info("GMI: no balance history for %s, fetching per day", _account_name(acc))
+            return {d: self.balance(acc, d) for d in days}
+        return _eod_balances(data, days)
+
+
+def fetch_gmi_bank_balances_eod(client: GetMyInvoicesClient, date: dt.date) -> dict[str, float]:
+    accounts = client.accounts()
+    amounts = run_bounded(
+        [("getmyinvoices", lambda acc=acc: client.balance(acc, date)) for acc in accounts],
+        client.max_workers,
+    )
+    return _collect(
+        [
+            (_account_name(acc), None if isinstance(amount, BaseException) else amount)
+            for acc, amount in zip(accounts, amounts)
+        ]
+    )
+
+
+def fetch_gmi_bank_balances_range(
+    client: GetMyInvoicesClient, first: dt.date, last: dt.date
+) -> dict[dt.date, dict[str, float | str]]:
+    """Per-date balance columns over [first, last], one history request per account."""
+    accounts = client.accounts()
+    histories = run_bounded(
+        [
+            ("getmyinvoices", lambda acc=acc: client.balance_history(acc, first, last))
+            for acc in accounts
+        ],
+        client.max_workers,
+    )
+    return {
+        d: _collect(
+            [
+                (_account_name(acc), None if isinstance(h, BaseException) else h.get(d))
+                for acc, h in zip(accounts, histories)
+            ]
+        )
+        for d in dates_in_range(first, last)
+    }
+
+
+async def fetch_gmi_bank_balances_eod_async(
+    client: GetMyInvoicesClient, date: dt.date, http: AsyncHttp
+) -> dict[str, float]:
+    """asyncio variant of `fetch_gmi_bank_balances_eod`; balances are requested concurrently."""
+    accounts = await client.accounts_async(http)
+
+    async def _balance(acc: dict) -> tuple[str, float | None]:
+        try:
+            bal = await _aget(
+                http,
+                f"/bank-accounts/{acc.get('id')}/balances",
+                client.api_key,
+                params={"date": date.isoformat()},
+            )
+            return _account_name(acc), float(bal.get("data", {}).get("amount"))
+        except Exception:
+            return _account_name(acc), None
+
+    return _collect(list(await asyncio.gather(*(_balance(acc) for acc in accounts))))
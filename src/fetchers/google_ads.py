@@ -1,9 +1,14 @@
 from __future__ import annotations
 
 import datetime as dt
+from functools import lru_cache
 
 from google.ads.googleads.client import GoogleAdsClient
 
+from .. import response_cache
+from ..util.datewin import dates_in_range
+from ..util.pool import run_bounded
+
 GA_QUERY = '''
 SELECT
   segments.date,
@@ -13,8 +18,13 @@ FROM customer
 WHERE segments.date BETWEEN '%(start)s' AND '%(end)s'
 '''
 
+# customers queried in parallel over the shared client
+MAX_CUSTOMER_WORKERS = 4
+
 
+@lru_cache(maxsize=None)
 def _client(dev_token, client_id, client_secret, refresh_token):
+    # loaded once per credential set and reused across dates and customers
     config = {
         "developer_token": dev_token,
         "client_id": client_id,
@@ -26,33 +36,85 @@ def _client(dev_token, client_id, client_secret, refresh_token):
     return GoogleAdsClient.load_from_dict(config)
 
 
-def fetch_google_ads_daily(
+def _stream_rows(ga_service, cid: str, query: str) -> list[list]:
+    # selected fields of every streamed row as [date, cost_micros, conversions_value]
+    return [
+        [
+            row.segments.date,
+            int(row.metrics.cost_micros or 0),
+            float(row.metrics.conversions_value or 0.0),
+        ]
+        for batch in ga_service.search_stream(customer_id=cid, query=query)
+        for row in batch.results
+    ]
+
+
+def _customer_daily(
+    ga_service, cid: str, first: dt.date, last: dt.date
+) -> dict[str, tuple[int, float]]:
+    # one search_stream over the window; rows are segmented by segments.date
+    query = GA_QUERY % {"start": first.strftime("%Y-%m-%d"), "end": last.strftime("%Y-%m-%d")}
+    rows = response_cache.cached_json(
+        "google_ads",
+        cid,
+        "search_stream",
+        {"query": query},
+        lambda: _stream_rows(ga_service, cid, query),
+    )
+    totals: dict[str, tuple[int, float]] = {}
+    for date, row_cost_micros, row_conv_value in rows:
+        cost_micros, conv_value = totals.get(date, (0, 0.0))
+        totals[date] = (cost_micros + row_cost_micros, conv_value + row_conv_value)
+    return totals
+
+
+def fetch_google_ads_range(
     dev_token: str,
     client_id: str,
     client_secret: str,
     refresh_token: str,
     customer_ids: list[str],
-    date: dt.date,
-) -> dict[str, float]:
-    out: dict[str, float | str] = {}
+    first: dt.date,
+    last: dt.date,
+) -> dict[dt.date, dict[str, float | str]]:
+    """Per-date columns for all customers over [first, last], one stream per customer.
+
+    Days without activity are reported as 0; a failing customer is N/A on every day.
+    """
+    days = dates_in_range(first, last)
+    out: dict[dt.date, dict[str, float | str]] = {d: {} for d in days}
     if not dev_token or not client_id or not client_secret or not refresh_token or not customer_ids:
         return out
-    client = _client(dev_token, client_id, client_secret, refresh_token)
-    ga_service = client.get_service("GoogleAdsService")
-    start = date.strftime("%Y-%m-%d")
-    end = date.strftime("%Y-%m-%d")
-    query = GA_QUERY % {"start": start, "end": end}
-    for cid in customer_ids:
-        try:
-            resp = ga_service.search(customer_id=cid, query=query)
-            cost_micros = 0
-            conv_value = 0.0
-            for row in resp:
-                cost_micros += int(row.metrics.cost_micros or 0)
-                conv_value += float(row.metrics.conversions_value or 0.0)
-            out[f"google_ads_{cid}_ausgaben_eur"] = round(cost_micros / 1_000_000.0, 2)
-            out[f"google_ads_{cid}_umsatz_eur"] = round(conv_value, 2)
-        except Exception:
-            out[f"google_ads_{cid}_ausgaben_eur"] = "N/A"
-            out[f"google_ads_{cid}_umsatz_eur"] = "N/A"
+    ga_service = _client(dev_token, client_id, client_secret, refresh_token).get_service(
+        "GoogleAdsService"
+    )
+    results = run_bounded(
+        [
+            ("google_ads", lambda cid=cid: _customer_daily(ga_service, cid, first, last))
+            for cid in customer_ids
+        ],
+        MAX_CUSTOMER_WORKERS,
+    )
+    for cid, res in zip(customer_ids, results):
+        for d in days:
+            if isinstance(res, BaseException):
+                out[d][f"google_ads_{cid}_ausgaben_eur"] = "N/A"
+                out[d][f"google_ads_{cid}_umsatz_eur"] = "N/A"
+                continue
+            cost_micros, conv_value = res.get(d.strftime("%Y-%m-%d"), (0, 0.0))
+            out[d][f"google_ads_{cid}_ausgaben_eur"] = round(cost_micros / 1_000_000.0, 2)
+            out[d][f"google_ads_{cid}_umsatz_eur"] = round(conv_value, 2)
     return out
+
+
+def fetch_google_ads_daily(
+    dev_token: str,
+    client_id: str,
+    client_secret: str,
+    refresh_token: str,
+    customer_ids: list[str],
+    date: dt.date,
+) -> dict[str, float]:
+    return fetch_google_ads_range(
+        dev_token, client_id, client_secret, refresh_token, customer_ids, date, date
+    )[date]
@@ -1,8 +1,166 @@
-
 from __future__ import annotations
-import requests, datetime as dt
+
+import asyncio
+import datetime as dt
+import logging
+from typing import Any
+
 from tenacity import retry, stop_after_attempt, wait_exponential
-from ..util.datewin import berlin_bounds_for_date
+
+from .. import response_cache, token_cache
+from ..util.async_http import AsyncHttp, is_unauthorized
+from ..util.datewin import berlin_bounds_for_date, berlin_bounds_for_range, dates_in_range
+from ..util.http_pool import session_for
+
+log = logging.getLogger(__name__)
+
+PAGE_LIMIT = 100
+# more sales channels than this per instance would need a higher terms limit
+CHANNEL_BUCKET_LIMIT = 500
+
+TOKEN_PROVIDER = "shopware6"
+# Shopware integration tokens are valid for 10 minutes unless the response says otherwise
+DEFAULT_TOKEN_TTL = 600
+
+
+def _orders_payload(start_iso: str, end_iso: str, sales_channel_id: str) -> dict[str, Any]:
+    # Sum of amountTotal (gross), orders created in [start,end)
+    return {
+        "filter": [
+            {"type":"range","field":"orderDateTime","parameters":{"gte": start_iso, "lt": end_iso}},
+            {"type":"equals","field":"salesChannelId","value": sales_channel_id}
+        ],
+        "associations": {},
+        "page": 1,
+        "limit": PAGE_LIMIT
+    }
+
+
+def _credit_notes_payload(start_iso: str, end_iso: str, sales_channel_id: str) -> dict[str, Any]:
+    # credit notes created in [start, end), joined to the sales channel through the
+    # document's order association, so only the day's documents are read
+    return {
+        "filter": [
+            {"type":"range","field":"createdAt","parameters":{"gte": start_iso, "lt": end_iso}},
+            {"type":"equals","field":"documentType.technicalName","value":"credit_note"},
+            {"type":"equals","field":"order.salesChannelId","value": sales_channel_id}
+        ],
+        "associations": {},
+        "page": 1,
+        "limit": PAGE_LIMIT
+    }
+
+
+def _per_channel_aggregation() -> dict[str, Any]:
+    return {
+        "name": "per_channel",
+        "type": "terms",
+        "field": "salesChannelId",
+        "limit": CHANNEL_BUCKET_LIMIT,
+        "aggregation": {"name": "gross", "type": "sum", "field": "amountTotal"},
+    }
+
+
+def _channel_totals_payload(start_iso: str, end_iso: str) -> dict[str, Any]:
+    # gross totals of all sales channels in one request: terms bucket per channel with a
+    # sum sub-aggregation; limit 1 and no total count, the entities themselves are not needed
+    return {
+        "filter": [
+            {"type":"range","field":"orderDateTime","parameters":{"gte": start_iso, "lt": end_iso}}
+        ],
+        "aggregations": [_per_channel_aggregation()],
+        "includes": {"order": ["id"]},
+        "total-count-mode": 0,
+        "page": 1,
+        "limit": 1
+    }
+
+
+def _daily_channel_totals_payload(start_iso: str, end_iso: str) -> dict[str, Any]:
+    # like _channel_totals_payload, nested in a per-day date histogram; no timeZone is
+    # passed so buckets use the same naive day boundaries as berlin_bounds_for_date
+    payload = _channel_totals_payload(start_iso, end_iso)
+    payload["aggregations"] = [
+        {
+            "name": "per_day",
+            "type": "histogram",
+            "field": "orderDateTime",
+            "interval": "day",
+            "format": "Y-m-d",
+            "aggregation": _per_channel_aggregation(),
+        }
+    ]
+    return payload
+
+
+def _aggregations(data: dict) -> dict:
+    aggregations = data.get("aggregations")
+    if aggregations is None:
+        aggregations = (data.get("meta") or {})["aggregations"]
+    return aggregations
+
+
+def _channel_buckets(aggregation: dict) -> dict[str, float]:
+    totals: dict[str, float] = {}
+    for bucket in aggregation["buckets"]:
+        totals[bucket["key"]] = float((bucket.get("gross") or {}).get("sum") or 0.0)
+    return totals
+
+
+def _parse_channel_totals(data: dict) -> dict[str, float]:
+    """Read {salesChannelId: gross} from a per_channel terms aggregation.
+
+    Raises KeyError if the response carries no aggregation, so callers can fall back
+    to paging.
+    """
+    return _channel_buckets(_aggregations(data)["per_channel"])
+
+
+def _parse_daily_channel_totals(data: dict) -> dict[dt.date, dict[str, float]]:
+    """Read {day: {salesChannelId: gross}} from the per_day histogram; days without orders
+    are absent. Raises KeyError without aggregation support."""
+    out: dict[dt.date, dict[str, float]] = {}
+    for bucket in _aggregations(data)["per_day"]["buckets"]:
+        day = dt.date.fromisoformat(str(bucket["key"])[:10])
+        out[day] = _channel_buckets(bucket["per_channel"])
+    return out
+
+
+def _credit_note_day(doc: dict) -> dt.date | None:
+    created = (doc.get("attributes") or doc).get("createdAt")
+    return dt.date.fromisoformat(created[:10]) if created else None
+
+
+def _sum_amount_total(elements: list[dict]) -> float:
+    total = 0.0
+    for e in elements:
+        price = e.get("attributes", {}).get("amountTotal")
+        if price is not None:
+            total += float(price)
+    return total
+
+
+def _sum_credit_notes(elements: list[dict]) -> float:
+    total = 0.0
+    for d in elements:
+        # document totals are not standardized; fallback: try config or custom fields
+        # If unavailable, count each credit note as amountTotal from referenced order line items is non-trivial.
+        # Here we sum 'documentReferencing' amount when present in custom fields 'amountTotal'.
+        attrs = d.get("attributes", {})
+        custom = attrs.get("customFields") or {}
+        val = custom.get("amountTotal") or custom.get("total") or 0.0
+        try:
+            total += float(val)
+        except (TypeError, ValueError):
+            pass
+    return total
+
+
+def _channel_key_prefix(instance_name: str, ch: dict) -> tuple[str, str]:
+    ch_id = ch.get("id")
+    ch_name = (ch.get("attributes", {}) or {}).get("name") or ch_id[:8]
+    return ch_id, f"shopware6_{instance_name}_{ch_name}"
+
 
 class Shopware6Client:
     def __init__(self, name: str, base_url: str, client_id: str, client_secret: str):
@@ -10,140 +168,233 @@ class Shopware6Client:
         self.base_url = base_url.rstrip('/')
         self.client_id = client_id
         self.client_secret = client_secret
-        self._token = None
 
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=1, max=8))
-    def _auth(self):
+    def _auth(self) -> tuple[str, float]:
         url = f"{self.base_url}/api/oauth/token"
-        resp = requests.post(url, json={
+        resp = session_for(url).post(url, json={
             "grant_type": "client_credentials",
             "client_id": self.client_id,
             "client_secret": self.client_secret
         }, timeout=30)
         resp.raise_for_status()
-        self._token = resp.json()["access_token"]
+        data = resp.json()
+        return data["access_token"], data.get("expires_in", DEFAULT_TOKEN_TTL)
 
     def _headers(self):
-        if not self._token:
-            self._auth()
-        return {"Authorization": f"Bearer {self._token}", "Content-Type": "application/json"}
+        token = token_cache.get_or_refresh(TOKEN_PROVIDER, self.name, self._auth)
+        return {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=1, max=8))
-    def list_sales_channels(self) -> List[Dict]:
-        url = f"{self.base_url}/api/sales-channel"
-        r = requests.get(url, headers=self._headers(), timeout=30)
+    def _request(self, method: str, url: str, **kwargs: Any):
+        r = session_for(url).request(method, url, headers=self._headers(), **kwargs)
+        if r.status_code == 401:
+            # token revoked or expired early: refresh once
+            token_cache.invalidate(TOKEN_PROVIDER, self.name)
+            r = session_for(url).request(method, url, headers=self._headers(), **kwargs)
         r.raise_for_status()
-        return r.json().get("data", [])
+        return r
+
+    def _json(self, method: str, url: str, **kwargs: Any) -> Any:
+        # raw responses go through the response cache, keyed by endpoint and request body
+        return response_cache.cached_json(
+            TOKEN_PROVIDER,
+            self.name,
+            f"{method} {url}",
+            kwargs.get("json"),
+            lambda: self._request(method, url, **kwargs).json(),
+        )
 
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=1, max=8))
-    def search_orders_sum(self, start_iso: str, end_iso: str, sales_channel_id: str) -> float:
-        url = f"{self.base_url}/api/search/order"
-        # Sum of amountTotal (gross), orders created in [start,end)
-        payload = {
-            "filter": [
-                {"type":"range","field":"orderDateTime","parameters":{"gte": start_iso, "lt": end_iso}},
-                {"type":"equals","field":"salesChannelId","value": sales_channel_id}
-            ],
-            "associations": {},
-            "page": 1,
-            "limit": 100
-        }
-        total = 0.0
+    def list_sales_channels(self) -> list[dict]:
+        url = f"{self.base_url}/api/sales-channel"
+        return self._json("GET", url, timeout=30).get("data", [])
+
+    def _search_all(self, url: str, payload: dict[str, Any]) -> list[dict]:
+        elements_all: list[dict] = []
         while True:
-            r = requests.post(url, headers=self._headers(), json=payload, timeout=45)
-            r.raise_for_status()
-            data = r.json()
-            elements = data.get("data", [])
-            for e in elements:
-                price = e.get("attributes", {}).get("amountTotal")
-                if price is not None:
-                    total += float(price)
+            elements = self._json("POST", url, json=payload, timeout=45).get("data", [])
+            elements_all.extend(elements)
             if len(elements) < payload["limit"]:
                 break
             payload["page"] += 1
-        return total
+        return elements_all
 
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=1, max=8))
-    def search_credit_notes_sum(self, start_iso: str, end_iso: str, sales_channel_id: str) -> float:
-        # Approximation: sum of document type 'credit_note' created yesterday filtered by order's salesChannelId
-        # We need to join via orderId; Shopware search API allows nested filter via associations isn't trivial.
-        # Strategy: fetch relevant orders, then fetch documents per order.
-        url_orders = f"{self.base_url}/api/search/order"
-        payload = {
-            "filter": [
-                {"type":"range","field":"orderDateTime","parameters":{"lt": end_iso}},  # include all up to end
-                {"type":"equals","field":"salesChannelId","value": sales_channel_id}
-            ],
-            "associations": {},
-            "page": 1,
-            "limit": 100
-        }
-        order_ids: List[str] = []
-        while True:
-            r = requests.post(url_orders, headers=self._headers(), json=payload, timeout=45)
-            r.raise_for_status()
-            data = r.json()
-            elements = data.get("data", [])
-            for e in elements:
-                order_ids.append(e.get("id"))
-            if len(elements) < payload["limit"]:
-                break
-            payload["page"] += 1
+    def search_orders_sum(self, start_iso: str, end_iso: str, sales_channel_id: str) -> float:
+        url = f"{self.base_url}/api/search/order"
+        payload = _orders_payload(start_iso, end_iso, sales_channel_id)
+        return _sum_amount_total(self._search_all(url, payload))
+
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=1, max=8))
+    def _post_search(self, url: str, payload: dict[str, Any]) -> dict:
+        return self._json("POST", url, json=payload, timeout=45)
+
+    def search_orders_totals_by_channel(self, start_iso: str, end_iso: str) -> dict[str, float]:
+        """Gross order totals per salesChannelId in [start, end) via a single aggregation request.
 
-        if not order_ids:
-            return 0.0
+        Channels without orders are absent from the result.
+        """
+        url = f"{self.base_url}/api/search/order"
+        return _parse_channel_totals(
+            self._post_search(url, _channel_totals_payload(start_iso, end_iso))
+        )
+
+    def search_orders_totals_by_day(
+        self, start_iso: str, end_iso: str
+    ) -> dict[dt.date, dict[str, float]]:
+        """Gross order totals per day and salesChannelId over [start, end) in one request."""
+        url = f"{self.base_url}/api/search/order"
+        return _parse_daily_channel_totals(
+            self._post_search(url, _daily_channel_totals_payload(start_iso, end_iso))
+        )
 
-        total = 0.0
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=1, max=8))
+    def search_credit_notes_by_day(
+        self, start_iso: str, end_iso: str, sales_channel_id: str
+    ) -> dict[dt.date, float]:
+        """Credit-note totals of a channel over [start, end), bucketed by creation day."""
+        url_docs = f"{self.base_url}/api/search/document"
+        payload = _credit_notes_payload(start_iso, end_iso, sales_channel_id)
+        docs = self._search_all(url_docs, payload)
+        out: dict[dt.date, float] = {}
+        for doc in docs:
+            day = _credit_note_day(doc)
+            if day is not None:
+                out[day] = out.get(day, 0.0) + _sum_credit_notes([doc])
+        return out
+
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=1, max=8))
+    def search_credit_notes_sum(self, start_iso: str, end_iso: str, sales_channel_id: str) -> float:
+        # Approximation: sum of document type 'credit_note' created in [start, end) for the channel
         url_docs = f"{self.base_url}/api/search/document"
-        # filter by createdAt in [start, end), by documentType.technicalName == 'credit_note' and orderId in order_ids
-        # Shopware search supports "equalsAny" for ID arrays
-        CHUNK = 100
-        for i in range(0, len(order_ids), CHUNK):
-            chunk = order_ids[i:i+CHUNK]
-            payload_docs = {
-                "filter": [
-                    {"type":"range","field":"createdAt","parameters":{"gte": start_iso, "lt": end_iso}},
-                    {"type":"equals","field":"documentType.technicalName","value":"credit_note"},
-                    {"type":"equalsAny","field":"orderId","value":"|".join(chunk)}
-                ],
-                "associations": {},
-                "page": 1,
-                "limit": 100
-            }
+        payload = _credit_notes_payload(start_iso, end_iso, sales_channel_id)
+        return _sum_credit_notes(self._search_all(url_docs, payload))
+
+
+class AsyncShopware6Client:
+    """asyncio counterpart of `Shopware6Client` on a shared `AsyncHttp`.
+
+    Searches request the total count with the first page and fetch the remaining
+    pages concurrently.
+    """
+
+    def __init__(
+        self, name: str, base_url: str, client_id: str, client_secret: str, http: AsyncHttp
+    ):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.http = http
+        self._auth_lock = asyncio.Lock()
+
+    async def _headers(self) -> dict[str, str]:
+        token = token_cache.get(TOKEN_PROVIDER, self.name)
+        if token is None:
+            async with self._auth_lock:
+                token = token_cache.get(TOKEN_PROVIDER, self.name)
+                if token is None:
+                    data = await self.http.post_json(
+                        f"{self.base_url}/api/oauth/token",
+                        json={
+                            "grant_type": "client_credentials",
+                            "client_id": self.client_id,
+                            "client_secret": self.client_secret,
+                        },
+                        timeout=30,
+                    )
+                    token = data["access_token"]
+                    token_cache.put(
+                        TOKEN_PROVIDER, self.name, token, data.get("expires_in", DEFAULT_TOKEN_TTL)
+                    )
+        return {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+
+    async def _call(self, method: str, url: str, **kwargs: Any) -> Any:
+        async def _fetch() -> Any:
+            try:
+                r = await self.http.request(method, url, headers=await self._headers(), **kwargs)
+            except Exception as e:
+                if not is_unauthorized(e):
+                    raise
+                token_cache.invalidate(TOKEN_PROVIDER, self.name)
+                r = await self.http.request(method, url, headers=await self._headers(), **kwargs)
+            return r.json()
+
+        return await response_cache.acached_json(
+            TOKEN_PROVIDER, self.name, f"{method} {url}", kwargs.get("json"), _fetch
+        )
+
+    async def list_sales_channels(self) -> list[dict]:
+        data = await self._call("GET", f"{self.base_url}/api/sales-channel", timeout=30)
+        return data.get("data", [])
+
+    async def _search_all(self, url: str, payload: dict[str, Any]) -> list[dict]:
+        first = await self._call("POST", url, json={**payload, "total-count-mode": 1})
+        elements: list[dict] = list(first.get("data", []))
+        total = first.get("total", (first.get("meta") or {}).get("total"))
+        if len(elements) < payload["limit"]:
+            return elements
+        if total is None:
+            # no count available: walk the remaining pages one by one
+            page = payload["page"]
             while True:
-                r = requests.post(url_docs, headers=self._headers(), json=payload_docs, timeout=45)
-                r.raise_for_status()
-                data = r.json()
-                elements = data.get("data", [])
-                for d in elements:
-                    # document totals are not standardized; fallback: try config or custom fields
-                    # If unavailable, count each credit note as amountTotal from referenced order line items is non-trivial.
-                    # Here we sum 'documentReferencing' amount when present in custom fields 'amountTotal'.
-                    attrs = d.get("attributes", {})
-                    custom = attrs.get("customFields") or {}
-                    val = custom.get("amountTotal") or custom.get("total") or 0.0
-                    try:
-                        total += float(val)
-                    except:
-                        pass
-                if len(elements) < payload_docs["limit"]:
-                    break
-                payload_docs["page"] += 1
-        return total
-
-def fetch_shopware_daily(instance: Shopware6Client, date: dt.date) -> Dict[str, float]:
+                page += 1
+                data = await self._call("POST", url, json={**payload, "page": page})
+                batch = data.get("data", [])
+                elements.extend(batch)
+                if len(batch) < payload["limit"]:
+                    return elements
+        pages = -(-int(total) // payload["limit"])
+        rest = await asyncio.gather(
+            *(
+                self._call("POST", url, json={**payload, "page": p})
+                for p in range(payload["page"] + 1, pages + 1)
+            )
+        )
+        for data in rest:
+            elements.extend(data.get("data", []))
+        return elements
+
+    async def search_orders_sum(self, start_iso: str, end_iso: str, sales_channel_id: str) -> float:
+        url = f"{self.base_url}/api/search/order"
+        payload = _orders_payload(start_iso, end_iso, sales_channel_id)
+        return _sum_amount_total(await self._search_all(url, payload))
+
+    async def search_orders_totals_by_channel(
+        self, start_iso: str, end_iso: str
+    ) -> dict[str, float]:
+        url = f"{self.base_url}/api/search/order"
+        data = await self._call("POST", url, json=_channel_totals_payload(start_iso, end_iso))
+        return _parse_channel_totals(data)
+
+    async def search_credit_notes_sum(
+        self, start_iso: str, end_iso: str, sales_channel_id: str
+    ) -> float:
+        url_docs = f"{self.base_url}/api/search/document"
+        payload = _credit_notes_payload(start_iso, end_iso, sales_channel_id)
+        return _sum_credit_notes(await self._search_all(url_docs, payload))
+
+
+def fetch_shopware_daily(instance: Shopware6Client, date: dt.date) -> dict[str, float]:
     start, end = berlin_bounds_for_date(date)
     start_iso = start.isoformat()
     end_iso = end.isoformat()
-    out: Dict[str, float] = {}
+    out: dict[str, float | str] = {}
     channels = instance.list_sales_channels()
+    try:
+        totals = instance.search_orders_totals_by_channel(start_iso, end_iso)
+    except Exception:
+        log.warning("Shopware %s: no aggregation support, paging per channel", instance.name)
+        totals = None
     for ch in channels:
-        ch_id = ch.get("id")
-        ch_name = (ch.get("attributes", {}) or {}).get("name") or ch_id[:8]
-        key_sales = f"shopware6_{instance.name}_{ch_name}_umsatz_brutto_eur"
-        key_ret = f"shopware6_{instance.name}_{ch_name}_retouren_eur"
+        ch_id, prefix = _channel_key_prefix(instance.name, ch)
+        key_sales = f"{prefix}_umsatz_brutto_eur"
+        key_ret = f"{prefix}_retouren_eur"
         try:
-            sales = instance.search_orders_sum(start_iso, end_iso, ch_id)
+            if totals is not None:
+                sales = totals.get(ch_id, 0.0)
+            else:
+                sales = instance.search_orders_sum(start_iso, end_iso, ch_id)
         except Exception:
             sales = None
         try:
@@ -153,3 +404,82 @@ def fetch_shopware_daily(instance: Shopware6Client, date: dt.date) -> Dict[str,
         out[key_sales] = round(sales, 2) if sales is not None else "N/A"
         out[key_ret] = round(returns, 2) if returns is not None else "N/A"
     return out
+
+
+def fetch_shopware_range(
+    instance: Shopware6Client, first: dt.date, last: dt.date
+) -> dict[dt.date, dict[str, float]]:
+    """Fetch every day in [first, last] with a handful of requests: the channel list, one
+    per-day histogram aggregation for all channels, and one credit-note search per channel.
+
+    Returns {date: row} with the same keys as `fetch_shopware_daily`. Without aggregation
+    support it falls back to the daily fetch for each date.
+    """
+    start, end = berlin_bounds_for_range(first, last)
+    start_iso = start.isoformat()
+    end_iso = end.isoformat()
+    days = dates_in_range(first, last)
+    try:
+        totals = instance.search_orders_totals_by_day(start_iso, end_iso)
+    except Exception:
+        log.warning("Shopware %s: no histogram support, fetching day by day", instance.name)
+        return {d: fetch_shopware_daily(instance, d) for d in days}
+
+    out: dict[dt.date, dict[str, float | str]] = {d: {} for d in days}
+    for ch in instance.list_sales_channels():
+        ch_id, prefix = _channel_key_prefix(instance.name, ch)
+        try:
+            returns: dict[dt.date, float] | None = instance.search_credit_notes_by_day(
+                start_iso, end_iso, ch_id
+            )
+        except Exception:
+            returns = None
+        for d in days:
+            out[d][f"{prefix}_umsatz_brutto_eur"] = round(totals.get(d, {}).get(ch_id, 0.0), 2)
+            out[d][f"{prefix}_retouren_eur"] = (
+                round(returns.get(d, 0.0), 2) if returns is not None else "N/A"
+            )
+    return out  # type: ignore[return-value]
+
+
+async def fetch_shopware_daily_async(
+    instance: AsyncShopware6Client, date: dt.date
+) -> dict[str, float]:
+    start, end = berlin_bounds_for_date(date)
+    start_iso = start.isoformat()
+    end_iso = end.isoformat()
+    channels = await instance.list_sales_channels()
+    try:
+        totals = await instance.search_orders_totals_by_channel(start_iso, end_iso)
+    except Exception:
+        log.warning("Shopware %s: no aggregation support, paging per channel", instance.name)
+        totals = None
+
+    async def _sales(ch_id: str) -> float:
+        if totals is not None:
+            return totals.get(ch_id, 0.0)
+        return await instance.search_orders_sum(start_iso, end_iso, ch_id)
+
+    async def _channel(ch: dict) -> dict[str, float | str]:
+        ch_id, prefix = _channel_key_prefix(instance.name, ch)
+        sales, returns = await asyncio.gather(
+            _sales(ch_id),
+            instance.search_credit_notes_sum(start_iso, end_iso, ch_id),
+            return_exceptions=True,
+        )
+        for res in (sales, returns):
+            if isinstance(res, response_cache.ResponseCacheMiss):
+                raise res
+        return {
+            f"{prefix}_umsatz_brutto_eur": (
+                round(sales, 2) if not isinstance(sales, BaseException) else "N/A"
+            ),
+            f"{prefix}_retouren_eur": (
+                round(returns, 2) if not isinstance(returns, BaseException) else "N/A"
+            ),
+        }
+
+    out: dict[str, float | str] = {}
+    for part in await asyncio.gather(*(_channel(ch) for ch in channels)):
+        out.update(part)
+    return out
@@ -1,18 +1,37 @@
 from __future__ import annotations
 
+import asyncio
 import datetime as dt
 import hashlib
 import hmac
 import json
 import logging
 import time
+from functools import partial
 from typing import Any
+from zoneinfo import ZoneInfo
 
-import requests
-from tenacity import retry, stop_after_attempt, wait_exponential
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
+
+from .. import response_cache, token_cache
+from ..util.async_http import AsyncHttp
+from ..util.async_http import is_unauthorized as is_unauthorized_async
+from ..util.datewin import dates_in_range
+from ..util.http_pool import is_unauthorized, retryable, session_for
+from ..util.pool import run_bounded
 
 log = logging.getLogger(__name__)
 
+TOKEN_PROVIDER = "tiktok"
+DEFAULT_TOKEN_TTL = 3600
+DEFAULT_BASE_URL = "https://open-api.tiktokglobalshop.com"
+# maximum page_size of the order and refund search endpoints
+PAGE_SIZE = 100
+BERLIN = ZoneInfo("Europe/Berlin")
+
+ORDERS_PATH = "/api/orders/search"
+REFUNDS_PATH = "/api/refunds/search"
+
 
 def _sign(secret: str, path: str, params: dict[str, Any]) -> str:
     """Create HMAC-SHA256 signature used by TikTok Shop Open API (approximation).
@@ -26,19 +45,23 @@ def _sign(secret: str, path: str, params: dict[str, Any]) -> str:
 @retry(stop=stop_after_attempt(3), wait=wait_exponential(min=1, max=8))
 def _post(base_url: str, path: str, payload: dict, headers: dict | None = None):
     url = f"{base_url.rstrip('/')}{path}"
-    r = requests.post(url, json=payload, headers=headers or {}, timeout=45)
+    r = session_for(url).post(url, json=payload, headers=headers or {}, timeout=45)
     r.raise_for_status()
     return r.json()
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(min=1, max=8))
+@retry(
+    retry=retry_if_exception(retryable),
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(min=1, max=8),
+)
 def _get(base_url: str, path: str, params: dict, headers: dict | None = None):
     url = f"{base_url.rstrip('/')}{path}"
-    r = requests.get(url, params=params, headers=headers or {}, timeout=45)
+    r = session_for(url).get(url, params=params, headers=headers or {}, timeout=45)
     r.raise_for_status()
     return r.json()
 
-def _refresh_access_token(base_url: str, app_key: str, app_secret: str, refresh_token: str) -> dict:
-    """Refresh access token; endpoint name may vary by app region/version.
+def _refresh_request(app_key: str, app_secret: str, refresh_token: str) -> tuple[str, dict]:
+    """Path and signed payload of a token refresh; endpoint name may vary by app region/version.
     This uses a common pattern: /api/token/refresh or /token/refresh.
     """
     ts = int(time.time())
@@ -50,6 +73,20 @@ def _refresh_access_token(base_url: str, app_key: str, app_secret: str, refresh_
     }
     sign = _sign(app_secret, path, payload)
     payload["sign"] = sign
+    return path, payload
+
+def _token_result(data: dict, refresh_token: str) -> tuple[str, float, dict[str, str]]:
+    # (access_token, expires_in, extra) for the token cache; refresh tokens rotate
+    data = data.get("data") or data
+    return (
+        data["access_token"],
+        _expires_in(data),
+        {"refresh_token": data.get("refresh_token") or refresh_token},
+    )
+
+def _refresh_access_token(base_url: str, app_key: str, app_secret: str, refresh_token: str) -> dict:
+    """Refresh access token (see `_refresh_request`)."""
+    path, payload = _refresh_request(app_key, app_secret, refresh_token)
     try:
         data = _post(base_url, path, payload)
         return data.get("data") or data
@@ -60,87 +97,266 @@ def _refresh_access_token(base_url: str, app_key: str, app_secret: str, refresh_
 def _auth_headers(access_token: str) -> dict[str, str]:
     return {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
 
-def fetch_tiktok_daily(account: dict, date: dt.date) -> dict[str, float]:
-    """Fetch gross sales and refunds for TikTok Shop for the given date.
+def _expires_in(data: dict) -> float:
+    # TikTok reports an absolute epoch for access_token_expire_in; older APIs a duration
+    value = data.get("access_token_expire_in") or data.get("expires_in")
+    if not value:
+        return DEFAULT_TOKEN_TTL
+    value = float(value)
+    return value - time.time() if value > 1e9 else value
+
+def _refresh_token_for(account: dict) -> str:
+    # refresh tokens rotate; prefer the latest one from the cache
+    return (
+        token_cache.get_extra(TOKEN_PROVIDER, account["name"], "refresh_token")
+        or account["refresh_token"]
+    )
+
+def _access_token(account: dict, base_url: str, force_refresh: bool = False) -> str:
+    """Cached token if still valid; the configured one until a refresh has happened;
+    otherwise (or when forced after a 401) refresh and cache with its expiry."""
+    name = account["name"]
+    if force_refresh:
+        token_cache.invalidate(TOKEN_PROVIDER, name)
+    else:
+        token = token_cache.get(TOKEN_PROVIDER, name)
+        if token:
+            return token
+        if token_cache.get_extra(TOKEN_PROVIDER, name, "refresh_token") is None:
+            return account["access_token"]
+
+    def _refresh() -> tuple[str, float, dict[str, str]]:
+        refresh_token = _refresh_token_for(account)
+        data = _refresh_access_token(
+            base_url, account["app_key"], account["app_secret"], refresh_token
+        )
+        return _token_result(data, refresh_token)
+
+    return token_cache.get_or_refresh(TOKEN_PROVIDER, name, _refresh)
+
+def _get_authed(account: dict, base_url: str, path: str, params: dict):
+    def _fetch():
+        try:
+            token = _access_token(account, base_url)
+            return _get(base_url, path, params, headers=_auth_headers(token))
+        except Exception as e:
+            if not is_unauthorized(e):
+                raise
+            token = _access_token(account, base_url, force_refresh=True)
+            return _get(base_url, path, params, headers=_auth_headers(token))
+
+    return response_cache.cached_json(TOKEN_PROVIDER, account["name"], path, params, _fetch)
+
+def _window(first: dt.date, last: dt.date | None = None) -> tuple[int, int]:
+    # [start of first, end of last) as epoch seconds, midnight to midnight Europe/Berlin
+    last = last or first
+    start = dt.datetime(first.year, first.month, first.day, tzinfo=BERLIN)
+    end = dt.datetime(last.year, last.month, last.day, tzinfo=BERLIN) + dt.timedelta(days=1)
+    return int(start.timestamp()), int(end.timestamp())
+
+
+def _berlin_day(ts: Any) -> dt.date | None:
+    try:
+        return dt.datetime.fromtimestamp(int(ts), BERLIN).date()
+    except (TypeError, ValueError):
+        return None
+
+
+def _shop_params(account: dict, params: dict[str, Any]) -> dict[str, Any]:
+    if account.get("shop_id"):
+        params["shop_id"] = account["shop_id"]
+    if account.get("seller_id"):
+        params["seller_id"] = account["seller_id"]
+    return params
+
+
+def _sales_params(account: dict, start_ts: int, end_ts: int) -> dict[str, Any]:
+    return _shop_params(account, {"create_time_from": start_ts, "create_time_to": end_ts})
+
+
+def _refund_params(account: dict, start_ts: int, end_ts: int) -> dict[str, Any]:
+    return _shop_params(account, {"update_time_from": start_ts, "update_time_to": end_ts})
+
+
+def _sum_amounts(items: list[dict], field: str) -> float:
+    total = 0.0
+    for o in items:
+        amt = (o.get(field) or {}).get("currency")
+        val = (o.get(field) or {}).get("total")
+        # Assume EUR; ignore non-EUR or convert externally
+        if amt in (None, "EUR"):
+            try:
+                total += float(val or 0.0)
+            except Exception:
+                pass
+    return total
+
+
+def _sum_by_day(
+    items: list[dict], field: str, time_field: str, days: list[dt.date]
+) -> dict[dt.date, float]:
+    """Sum `field` per Berlin day of `time_field`; for a single day, items without a
+    timestamp are counted on that day since the search window already bounds them."""
+    totals = {d: 0.0 for d in days}
+    for item in items:
+        day = _berlin_day(item.get(time_field))
+        if day is None and len(days) == 1:
+            day = days[0]
+        if day in totals:
+            totals[day] += _sum_amounts([item], field)
+    return totals
+
+
+def _search_all(
+    account: dict, base_url: str, path: str, params: dict[str, Any], items_key: str
+) -> list[dict]:
+    """Walk all pages of a search endpoint via next_page_token."""
+    items: list[dict] = []
+    page_token = None
+    while True:
+        page_params = {**params, "page_size": PAGE_SIZE}
+        if page_token:
+            page_params["page_token"] = page_token
+        data = _get_authed(account, base_url, path, page_params).get("data") or {}
+        items.extend(data.get(items_key) or [])
+        page_token = data.get("next_page_token")
+        if not page_token:
+            return items
+
+
+def fetch_tiktok_range(
+    account: dict, first: dt.date, last: dt.date
+) -> dict[dt.date, dict[str, float | str]]:
+    """Fetch gross sales and refunds per Berlin day over [first, last] with one paged
+    search each (run concurrently); orders are bucketed by create_time, refunds by update_time.
     Assumes EUR amounts; if your shop has multiple currencies, convert upstream.
     account keys: name, base_url, app_key, app_secret, access_token, refresh_token, shop_id|seller_id
     """
     name = account["name"]
-    base_url = account.get("base_url") or "https://open-api.tiktokglobalshop.com"
-    app_key = account["app_key"]
-    app_secret = account["app_secret"]
-    access_token = account["access_token"]
-    refresh_token = account["refresh_token"]
-    shop_id = account.get("shop_id")
-    seller_id = account.get("seller_id")
+    base_url = account.get("base_url") or DEFAULT_BASE_URL
+    days = dates_in_range(first, last)
+    start_ts, end_ts = _window(first, last)
+
+    key_sales = f"tiktok_{name}_umsatz_brutto_eur"
+    key_returns = f"tiktok_{name}_retouren_eur"
+    out: dict[dt.date, dict[str, float | str]] = {
+        d: {key_sales: "N/A", key_returns: "N/A"} for d in days
+    }
+
+    # Endpoint paths may vary; adjust to your app's spec
+    sales_params = _sales_params(account, start_ts, end_ts)
+    refund_params = _refund_params(account, start_ts, end_ts)
+    sales, refunds = run_bounded(
+        [
+            (
+                "tiktok",
+                partial(_search_all, account, base_url, ORDERS_PATH, sales_params, "orders"),
+            ),
+            (
+                "tiktok",
+                partial(_search_all, account, base_url, REFUNDS_PATH, refund_params, "refunds"),
+            ),
+        ],
+        max_workers=2,
+    )
+
+    # 1) Sales: sum order totals for orders created on each day
+    if isinstance(sales, BaseException):
+        log.error("TikTok sales fetch failed for %s: %s", name, sales)
+    else:
+        for d, total in _sum_by_day(sales, "order_amount", "create_time", days).items():
+            out[d][key_sales] = round(total, 2)
+
+    # 2) Returns/Refunds: sum refund amounts posted on each day
+    if isinstance(refunds, BaseException):
+        log.error("TikTok refunds fetch failed for %s: %s", name, refunds)
+    else:
+        for d, total in _sum_by_day(refunds, "refund_amount", "update_time", days).items():
+            out[d][key_returns] = round(abs(total), 2)
+
+    return out
+
+
+def fetch_tiktok_daily(account: dict, date: dt.date) -> dict[str, float]:
+    """Fetch gross sales and refunds for TikTok Shop for the given date."""
+    return fetch_tiktok_range(account, date, date)[date]  # type: ignore[return-value]
+
+
+async def fetch_tiktok_daily_async(
+    account: dict, date: dt.date, http: AsyncHttp
+) -> dict[str, float]:
+    """asyncio variant of `fetch_tiktok_daily`; sales and refunds are queried concurrently."""
+    name = account["name"]
+    base_url = (account.get("base_url") or DEFAULT_BASE_URL).rstrip("/")
+    start_ts, end_ts = _window(date)
+
+    async def _refresh() -> tuple[str, float, dict[str, str]]:
+        refresh_token = _refresh_token_for(account)
+        path, payload = _refresh_request(account["app_key"], account["app_secret"], refresh_token)
+        return _token_result(await http.post_json(f"{base_url}{path}", json=payload), refresh_token)
 
-    start = dt.datetime(date.year, date.month, date.day, 0, 0, 0)
-    end = start + dt.timedelta(days=1)
+    async def _token(force_refresh: bool = False) -> str:
+        # same rules as `_access_token`; one refresh per shop across all concurrent dates
+        if force_refresh:
+            token_cache.invalidate(TOKEN_PROVIDER, name)
+        else:
+            token = token_cache.get(TOKEN_PROVIDER, name)
+            if token:
+                return token
+            if token_cache.get_extra(TOKEN_PROVIDER, name, "refresh_token") is None:
+                return account["access_token"]
+        return await token_cache.aget_or_refresh(TOKEN_PROVIDER, name, _refresh)
+
+    async def _page(path: str, params: dict[str, Any]) -> Any:
+        url = f"{base_url}{path}"
+
+        async def _fetch() -> Any:
+            try:
+                headers = _auth_headers(await _token())
+                return await http.get_json(url, params=params, headers=headers)
+            except Exception as e:
+                if not is_unauthorized_async(e):
+                    raise
+                token = await _token(force_refresh=True)
+                return await http.get_json(url, params=params, headers=_auth_headers(token))
+
+        return await response_cache.acached_json(TOKEN_PROVIDER, name, path, params, _fetch)
+
+    async def _search_all_async(path: str, params: dict[str, Any], items_key: str) -> list[dict]:
+        items: list[dict] = []
+        page_token = None
+        while True:
+            page_params = {**params, "page_size": PAGE_SIZE}
+            if page_token:
+                page_params["page_token"] = page_token
+            data = (await _page(path, page_params)).get("data") or {}
+            items.extend(data.get(items_key) or [])
+            page_token = data.get("next_page_token")
+            if not page_token:
+                return items
+
+    sales, refunds = await asyncio.gather(
+        _search_all_async(ORDERS_PATH, _sales_params(account, start_ts, end_ts), "orders"),
+        _search_all_async(REFUNDS_PATH, _refund_params(account, start_ts, end_ts), "refunds"),
+        return_exceptions=True,
+    )
+    for res in (sales, refunds):
+        # a replay cache miss means no data for this source, not N/A
+        if isinstance(res, response_cache.ResponseCacheMiss):
+            raise res
 
     out: dict[str, float | str] = {
         f"tiktok_{name}_umsatz_brutto_eur": "N/A",
         f"tiktok_{name}_retouren_eur": "N/A",
     }
-
-    # Ensure token works; refresh if needed (best-effort)
-    try:
-        _ = _get(base_url, "/api/ping", {}, headers=_auth_headers(access_token))
-    except Exception:
-        try:
-            data = _refresh_access_token(base_url, app_key, app_secret, refresh_token)
-            access_token = data.get("access_token", access_token)
-        except Exception:
-            pass
-
-    # 1) Sales: sum order totals for orders created yesterday
-    try:
-        params = {
-            "create_time_from": int(start.timestamp()),
-            "create_time_to": int(end.timestamp()),
-        }
-        if shop_id:
-            params["shop_id"] = shop_id
-        if seller_id:
-            params["seller_id"] = seller_id
-        # Endpoint path may vary; adjust to your app's spec (e.g., /api/orders/search)
-        data = _get(base_url, "/api/orders/search", params, headers=_auth_headers(access_token))
-        total = 0.0
-        for o in data.get("data", {}).get("orders", []):
-            amt = (o.get("order_amount") or {}).get("currency")
-            val = (o.get("order_amount") or {}).get("total")
-            # Assume EUR; ignore non-EUR or convert externally
-            if amt in (None, "EUR"):
-                try:
-                    total += float(val or 0.0)
-                except Exception:
-                    pass
+    if isinstance(sales, BaseException):
+        log.error("TikTok sales fetch failed for %s: %s", name, sales)
+    else:
+        total = _sum_amounts(sales, "order_amount")
         out[f"tiktok_{name}_umsatz_brutto_eur"] = round(total, 2)
-    except Exception as e:
-        log.exception("TikTok sales fetch failed for %s: %s", name, e)
-
-    # 2) Returns/Refunds: sum refund amounts posted yesterday
-    try:
-        params = {
-            "update_time_from": int(start.timestamp()),
-            "update_time_to": int(end.timestamp()),
-        }
-        if shop_id:
-            params["shop_id"] = shop_id
-        if seller_id:
-            params["seller_id"] = seller_id
-        # Endpoint path may vary; adjust to your app's spec (e.g., /api/refunds/search)
-        data = _get(base_url, "/api/refunds/search", params, headers=_auth_headers(access_token))
-        total_refunds = 0.0
-        for r in data.get("data", {}).get("refunds", []):
-            amt = (r.get("refund_amount") or {}).get("currency")
-            val = (r.get("refund_amount") or {}).get("total")
-            if amt in (None, "EUR"):
-                try:
-                    total_refunds += float(val or 0.0)
-                except Exception:
-                    pass
+    if isinstance(refunds, BaseException):
+        log.error("TikTok refunds fetch failed for %s: %s", name, refunds)
+    else:
+        total_refunds = _sum_amounts(refunds, "refund_amount")
         out[f"tiktok_{name}_retouren_eur"] = round(abs(total_refunds), 2)
-    except Exception as e:
-        log.exception("TikTok refunds fetch failed for %s: %s", name, e)
-
     return out  # type: ignore[return-value]
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import datetime as dt
+import json
+import os
+import pathlib
+from typing import Any
+
+STATUS_OK = "ok"
+STATUS_FAILED = "failed"
+
+
+def status_for(values: dict[str, Any] | None) -> str:
+    """A fetch counts as failed if it raised (None) or reported any value as N/A."""
+    if values is None:
+        return STATUS_FAILED
+    if any(v is None or v == "N/A" for v in values.values()):
+        return STATUS_FAILED
+    return STATUS_OK
+
+
+class HarvestLedger:
+    """Persistent record of which (source, date) pairs have been harvested.
+
+    Stored as JSON: ``{"entries": {source_id: {date: {"status", "fetched_at", "window"}}}}``.
+    A pair has to be (re-)fetched when it is missing, failed, or was last fetched
+    while the date was still settling (e.g. Google Ads conversion lag). ``window`` is
+    the ``[first, last]`` range request the date came from (absent for per-date
+    fetches), so a replay can ask the response cache for exactly the same request.
+    """
+
+    def __init__(self, path: str | os.PathLike[str]):
+        self.path = pathlib.Path(path)
+        self._entries: dict[str, dict[str, dict[str, Any]]] = {}
+        if self.path.exists():
+            data = json.loads(self.path.read_text(encoding="utf-8") or "{}")
+            self._entries = data.get("entries") or {}
+
+    def get(self, source_id: str, date: dt.date) -> dict[str, Any] | None:
+        return self._entries.get(source_id, {}).get(date.isoformat())
+
+    def window(self, source_id: str, date: dt.date) -> tuple[dt.date, dt.date] | None:
+        """The range fetch `date` was last harvested by, None if it was fetched on its own."""
+        window = (self.get(source_id, date) or {}).get("window")
+        if not window:
+            return None
+        first, last = window
+        return dt.date.fromisoformat(first), dt.date.fromisoformat(last)
+
+    def record(
+        self,
+        source_id: str,
+        date: dt.date,
+        status: str,
+        fetched_at: dt.datetime | None = None,
+        window: tuple[dt.date, dt.date] | None = None,
+    ) -> None:
+        fetched_at = fetched_at or dt.datetime.now()
+        entry: dict[str, Any] = {
+            "status": status,
+            "fetched_at": fetched_at.isoformat(timespec="seconds"),
+        }
+        if window is not None:
+            entry["window"] = [window[0].isoformat(), window[1].isoformat()]
+        self._entries.setdefault(source_id, {})[date.isoformat()] = entry
+
+    def needs_fetch(self, source_id: str, date: dt.date, settling_days: int) -> bool:
+        entry = self.get(source_id, date)
+        if entry is None or entry.get("status") != STATUS_OK:
+            return True
+        fetched_at = dt.datetime.fromisoformat(entry["fetched_at"])
+        # fetched before the date settled -> values may still have moved
+        if fetched_at.date() < date + dt.timedelta(days=settling_days):
+            return True
+        return False
+
+    def plan(
+        self,
+        source_ids: list[str],
+        dates: list[dt.date],
+        settling_days: int,
+        force_dates: set[dt.date] | None = None,
+    ) -> dict[dt.date, list[str]]:
+        """Map each date that needs work to the source ids to fetch for it (oldest first)."""
+        force_dates = force_dates or set()
+        out: dict[dt.date, list[str]] = {}
+        for d in sorted(dates):
+            if d in force_dates:
+                todo = list(source_ids)
+            else:
+                todo = [s for s in source_ids if self.needs_fetch(s, d, settling_days)]
+            if todo:
+                out[d] = todo
+        return out
+
+    def prune(self, oldest: dt.date) -> None:
+        cutoff = oldest.isoformat()
+        for per_date in self._entries.values():
+            for key in [k for k in per_date if k < cutoff]:
+                del per_date[key]
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(
+            json.dumps({"entries": self._entries}, indent=1, sort_keys=True), encoding="utf-8"
+        )
+        os.replace(tmp, self.path)
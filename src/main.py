@@ -1,25 +1,36 @@
 
 from __future__ import annotations
+import asyncio
+import contextlib
 import os
+import sys
 import datetime as dt
-from dotenv import load_dotenv
+from functools import partial
 from dotenv import load_dotenv
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 
+from . import response_cache, token_cache
 from .config import Settings
+from .ledger import HarvestLedger, status_for
 from .logger import setup_logger
-from .sheets import get_sheet, ensure_headers, write_row, color_cell
-from .anomaly import classify
+from .sheets import (
+    GREEN,
+    RED,
+    ColumnRegistry,
+    FormatQueue,
+    RowWriter,
+    WorksheetSnapshot,
+    get_sheet,
+)
+from .anomaly import NormEngine, classify_matrix
 from .notify import send_email
-from .openai_notes import write_notes
-
-from .fetchers.shopware6 import Shopware6Client, fetch_shopware_daily
-from .fetchers.getmyinvoices import fetch_gmi_bank_balances_eod
-from .fetchers.google_ads import fetch_google_ads_daily
-from .fetchers.amazon import fetch_amazon_daily
-from .fetchers.ebay import fetch_ebay_daily
-from .fetchers.tiktok_shop import fetch_tiktok_daily
+from .openai_notes import NoteWriter
+from .sources import Source, build_sources, google_ads_customer_ids
+from .store import MetricStore
+from .util.async_http import AsyncHttp
+from .util import http_pool, sheets_quota
+from .util.pool import run_bounded
 
 log = setup_logger()
 
@@ -34,10 +45,9 @@ def enumerate_dynamic_keys(settings: Settings) -> dict:
     dummy: dict = {}
     # Shopware Channels are dynamic -> cannot know names before first run; leave empty here.
     # Google Ads
-    if settings.GOOGLE_ADS_CUSTOMER_IDS:
-        for cid in [c.strip() for c in settings.GOOGLE_ADS_CUSTOMER_IDS.split(",") if c.strip()]:
-            dummy[f"google_ads_{cid}_ausgaben_eur"] = ""
-            dummy[f"google_ads_{cid}_umsatz_eur"] = ""
+    for cid in google_ads_customer_ids(settings):
+        dummy[f"google_ads_{cid}_ausgaben_eur"] = ""
+        dummy[f"google_ads_{cid}_umsatz_eur"] = ""
     # Amazon
     for acc in settings.AMAZON_ACCOUNTS:
         dummy[f"amazon_{acc.name}_umsatz_brutto_eur"] = ""
@@ -49,85 +59,155 @@ def enumerate_dynamic_keys(settings: Settings) -> dict:
     dummy["bank_gesamt_kontostand_eur"] = ""
     return dummy
 
+def _replayable(fn):
+    # a replay cache miss is that source's result (no data), not a failure of the whole run
+    def _run():
+        try:
+            return fn()
+        except response_cache.ResponseCacheMiss as e:
+            return e
+
+    return _run
+
+def _merge_results(
+    selected: list[Source], results: list[dict | BaseException | None]
+) -> tuple[dict, dict[str, str]]:
+    # merge in source order so the row dict is deterministic; sources whose responses
+    # are not in the replay cache are left out entirely (no values, no ledger status)
+    row: dict = {}
+    statuses: dict[str, str] = {}
+    for source, values in zip(selected, results):
+        if isinstance(values, response_cache.ResponseCacheMiss):
+            log.info("Replay: keine Antwort im Cache für %s (%s)", source.id, values)
+            continue
+        if isinstance(values, BaseException):
+            log.error("Fetch failed for %s: %s", source.id, values, exc_info=values)
+            values = None
+        if values:
+            row.update(values)
+        statuses[source.id] = status_for(values)
+    return row, statuses
+
 def fetch_all_for_date(
-    settings: Settings,
+    sources: list[Source],
     target_date: dt.date,
-    sh,
-    ws,
-) -> tuple[dict, list[tuple[str, int, int]]]:
-    # returns row data dict and list of (column_key, row_idx, col_idx) for coloring after anomaly
-    # 1) Shopware
-    row: dict = {}
-    color_targets = []
+    only: list[str] | None = None,
+    max_workers: int = 1,
+    limits: dict[str, int] | None = None,
+) -> tuple[dict, dict[str, str]]:
+    # returns row data dict and the harvest status per source id; sources run concurrently
+    selected = [s for s in sources if only is None or s.id in only]
+    results = run_bounded(
+        [(s.group, _replayable(partial(s.fetch, target_date))) for s in selected],
+        max_workers,
+        limits,
+    )
+    return _merge_results(selected, results)
 
-    for inst in settings.SHOPWARE6_INSTANCES:
-        client = Shopware6Client(inst.name, inst.base_url, inst.client_id, inst.client_secret)
-        try:
-            sw = fetch_shopware_daily(client, target_date)
-            row.update(sw)
-        except Exception as e:
-            log.exception("Shopware fetch failed for %s: %s", inst.name, e)
+def _consecutive_runs(days: list[dt.date]) -> list[list[dt.date]]:
+    # sorted dates -> runs of consecutive days
+    runs: list[list[dt.date]] = []
+    for d in days:
+        if runs and d - runs[-1][-1] == dt.timedelta(days=1):
+            runs[-1].append(d)
+        else:
+            runs.append([d])
+    return runs
 
-    # 2) GetMyInvoices
-    try:
-        if settings.GETMYINVOICES_API_KEY:
-            gmi = fetch_gmi_bank_balances_eod(settings.GETMYINVOICES_API_KEY, target_date)
-            row.update(gmi)
-    except Exception as e:
-        log.exception("GMI fetch failed: %s", e)
+# one range request: (source, first, last, planned dates it answers)
+RangeWindow = tuple[Source, dt.date, dt.date, list[dt.date]]
 
-    # 3) Google Ads
-    try:
-        if (
-            settings.GOOGLE_ADS_DEVELOPER_TOKEN
-            and settings.GOOGLE_ADS_CLIENT_ID
-            and settings.GOOGLE_ADS_CLIENT_SECRET
-            and settings.GOOGLE_ADS_REFRESH_TOKEN
-            and settings.GOOGLE_ADS_CUSTOMER_IDS
-        ):
-            ga = fetch_google_ads_daily(
-                settings.GOOGLE_ADS_DEVELOPER_TOKEN,
-                settings.GOOGLE_ADS_CLIENT_ID,
-                settings.GOOGLE_ADS_CLIENT_SECRET,
-                settings.GOOGLE_ADS_REFRESH_TOKEN,
-                [c.strip() for c in settings.GOOGLE_ADS_CUSTOMER_IDS.split(",") if c.strip()],
-                target_date
-            )
-            row.update(ga)
-    except Exception as e:
-        log.exception("Google Ads fetch failed: %s", e)
+def plan_windows(
+    sources: list[Source], plan: dict[dt.date, list[str]], min_days: int
+) -> list[RangeWindow]:
+    # sources with a range fetch get one window per run of at least min_days consecutive
+    # planned dates; isolated dates are left to the per-date fetch, so a sparse plan never
+    # walks the gaps in between
+    windows: list[RangeWindow] = []
+    for source in sources:
+        if source.fetch_range is None:
+            continue
+        days = sorted(d for d, ids in plan.items() if source.id in ids)
+        runs = [run for run in _consecutive_runs(days) if len(run) >= min_days]
+        windows.extend((source, run[0], run[-1], run) for run in runs)
+    return windows
 
-    # 4) Amazon
-    for acc in settings.AMAZON_ACCOUNTS:
-        try:
-            amz = fetch_amazon_daily(acc.model_dump(), target_date)
-            row.update(amz)
-        except Exception as e:
-            log.exception("Amazon fetch failed for %s: %s", acc.name, e)
+def replay_windows(
+    sources: list[Source], plan: dict[dt.date, list[str]], ledger: HarvestLedger
+) -> list[RangeWindow]:
+    # replay asks the cache for the very windows earlier runs requested (as recorded in
+    # the ledger), each answering the planned dates it was last harvested for; dates
+    # that were fetched on their own are left to the per-date fetch
+    grouped: dict[tuple[str, dt.date, dt.date], list[dt.date]] = {}
+    by_id = {s.id: s for s in sources if s.fetch_range is not None}
+    for d, ids in sorted(plan.items()):
+        for sid in ids:
+            window = ledger.window(sid, d) if sid in by_id else None
+            if window is not None:
+                grouped.setdefault((sid, *window), []).append(d)
+    return [(by_id[sid], first, last, days) for (sid, first, last), days in grouped.items()]
 
-    # 5) eBay
-    for acc in settings.EBAY_ACCOUNTS:
-        try:
-            eb = fetch_ebay_daily(acc.model_dump(), target_date)
-            row.update(eb)
-        except Exception as e:
-            log.exception("eBay fetch failed for %s: %s", acc.name, e)
+def fetch_ranges(
+    windows: list[RangeWindow],
+    max_workers: int = 1,
+    limits: dict[str, int] | None = None,
+) -> dict[dt.date, tuple[dict, dict[str, str]]]:
+    # one fetch_range per window; returns (row, statuses) per date like fetch_all_for_date
+    results = run_bounded(
+        [
+            (s.group, _replayable(partial(s.fetch_range, first, last)))
+            for s, first, last, _ in windows
+        ],
+        max_workers,
+        limits,
+    )
+    per_date: dict[dt.date, tuple[list[Source], list[dict | None]]] = {}
+    for (source, _, _, days), res in zip(windows, results):
+        if isinstance(res, response_cache.ResponseCacheMiss):
+            # window not in the replay cache: these dates go through the per-date fetch
+            log.info("Replay: Zeitfenster für %s nicht im Cache, Abruf je Tag", source.id)
+            continue
+        if isinstance(res, BaseException):
+            log.error("Range fetch failed for %s: %s", source.id, res, exc_info=res)
+            res = {}
+        for d in days:
+            selected, values = per_date.setdefault(d, ([], []))
+            selected.append(source)
+            values.append(res.get(d))
+    return {d: _merge_results(sel, vals) for d, (sel, vals) in sorted(per_date.items())}
 
-    return row, color_targets
+async def fetch_all_async(
+    sources: list[Source],
+    plan: dict[dt.date, list[str]],
+    max_workers: int,
+    limits: dict[str, int],
+    per_host: int,
+    pool_size: int = 10,
+) -> dict[dt.date, tuple[dict, dict[str, str]]]:
+    # harvests every planned (date, source) pair on one event loop; sources without an
+    # async variant run in worker threads, at most max_workers at a time
+    group_sems = {group: asyncio.Semaphore(max(1, n)) for group, n in limits.items()}
+    thread_sem = asyncio.Semaphore(max(1, max_workers))
 
-def compute_history(ws, headers, col_key) -> list[float]:
-    # read entire column (excluding header), parse to floats ignoring N/A
-    col_idx = headers.index(col_key) + 1
-    values = ws.col_values(col_idx)[1:]  # skip header
-    hist = []
-    for v in values:
-        try:
-            x = float(v)
-        except Exception:
+    async with AsyncHttp(per_host=per_host, pool_size=pool_size) as http:
+
+        async def _one(source: Source, d: dt.date):
+            async with group_sems.get(source.group) or contextlib.nullcontext():
+                if source.afetch is not None:
+                    return await source.afetch(d, http)
+                async with thread_sem:
+                    return await asyncio.to_thread(source.fetch, d)
 
-            x = None
-        hist.append(x)
-    return hist
+        jobs = {d: [s for s in sources if s.id in ids] for d, ids in plan.items()}
+        flat = [(d, s) for d, selected in jobs.items() for s in selected]
+        results = await asyncio.gather(*(_one(s, d) for d, s in flat), return_exceptions=True)
+
+    out: dict[dt.date, tuple[dict, dict[str, str]]] = {}
+    pos = 0
+    for d, selected in jobs.items():
+        out[d] = _merge_results(selected, list(results[pos : pos + len(selected)]))
+        pos += len(selected)
+    return out
 
 def job_run():
     load_dotenv(".env")
@@ -139,39 +219,165 @@ def job_run():
     except Exception:
         pass
 
+    # every Sheets request goes through one sliding-minute budget
+    sheets_quota.configure(settings.SHEETS_REQUESTS_PER_MINUTE)
     sh, ws = get_sheet(
         settings.GOOGLE_SPREADSHEET_ID,
         settings.GOOGLE_SHEET_TAB,
         settings.GOOGLE_SERVICE_ACCOUNT_JSON,
         settings.GOOGLE_SERVICE_ACCOUNT_FILE,
     )
-    # Determine date(s) to process: backfill if missing
+    # Determine date(s) to process: backfill window, narrowed down by the harvest ledger
     today = dt.datetime.now().date()
-    # Yesterday range or backfill logic
     backfill_days = settings.BACKFILL_DAYS
     dates = [today - dt.timedelta(days=i+1) for i in range(backfill_days)][::-1]  # oldest -> newest
 
-    # Build headers dynamically on first run; will extend later if new keys appear
+    # pooled keep-alive sessions for the blocking fetchers, shared for the whole run
+    http_pool.configure(settings.HTTP_POOL_SIZE)
+    # OAuth tokens (Shopware, eBay, TikTok) are reused across dates and runs until they expire
+    token_cache.configure(os.path.join(settings.STATE_DIR, "tokens.json"))
+    # raw responses are kept so aggregation changes can be re-applied without re-downloading
+    response_cache.configure(
+        os.path.join(settings.STATE_DIR, "responses"),
+        settings.RESPONSE_CACHE_MAX_MB * 1024 * 1024,
+        settings.RESPONSE_CACHE_TTL,
+        replay=settings.RESPONSE_CACHE_REPLAY,
+    )
+    sources = build_sources(settings)
+    ledger = HarvestLedger(os.path.join(settings.STATE_DIR, "harvest_ledger.json"))
+    ledger.prune(dates[0])
+    snapshot = WorksheetSnapshot.load(sh, ws)
+    # Local metric store is the system of record; the sheet is a projection of it.
+    # The first run with a store adopts what is already in the sheet.
+    store = MetricStore(os.path.join(settings.STATE_DIR, "metrics.sqlite3"))
+    if store.is_empty():
+        log.info("Metrik-Store aus Tabelle übernommen: %d Tage", store.import_snapshot(snapshot))
+    # incremental median norms, persisted between runs (rebuilt from the store if missing)
+    norms = NormEngine(os.path.join(settings.STATE_DIR, "norms.json"))
+    if norms.is_empty():
+        norms.seed(store.numeric_rows())
+    # Rows missing in the sheet are re-rendered from the store if it has them,
+    # otherwise fetched in full, whatever the ledger says
+    in_sheet = snapshot.dates()
+    missing = {d for d in dates if d.isoformat() not in in_sheet}
+    restorable = {d for d in missing if store.has_date(d)}
+    force_dates = missing - restorable
+    if response_cache.is_replay():
+        # replay: recompute every date from cached responses, nothing goes to the APIs
+        log.info("Replay-Modus: alle Tage werden aus dem Antwort-Cache neu berechnet")
+        restorable = set()
+        force_dates = set(dates)
+    plan = ledger.plan(
+        [s.id for s in sources],
+        dates,
+        settings.HARVEST_SETTLING_DAYS,
+        force_dates=force_dates,
+    )
+    log.info("Harvest-Plan: %d von %d Tagen abzurufen", len(plan), len(dates))
+
+    # Columns are append-only (registry in a hidden tab): a fresh sheet starts with
+    # datum, the known keys and notizen; keys that appear later go after the last column
     dynamic_keys = enumerate_dynamic_keys(settings)
-    headers = ["datum"] + sorted(dynamic_keys.keys()) + ["notizen"]
-    ensure_headers(ws, headers)
+    columns = ColumnRegistry.load(sh, ws, snapshot)
+    headers = columns.ensure(["datum"] + sorted(dynamic_keys) + ["notizen"])
+
+    writer = RowWriter(ws, snapshot)
+    formats = FormatQueue(sh, ws)
+    # ledger entries are only committed once their row has been flushed to the sheet
+    unflushed: list[tuple[dt.date, dict[str, str], dt.datetime]] = []
 
+    # Range-capable sources planned for runs of consecutive dates are fetched once per run
+    # (in replay: once per window recorded by the runs that filled the cache);
+    # only the rest goes through the per-date fetch below
+    if response_cache.is_replay():
+        windows = replay_windows(sources, plan, ledger)
+    else:
+        windows = plan_windows(sources, plan, settings.RANGE_MIN_DAYS)
+    window_of = {(s.id, d): (first, last) for s, first, last, days in windows for d in days}
+    ranged = fetch_ranges(windows, settings.FETCH_MAX_WORKERS, settings.FETCH_CONCURRENCY)
+
+    def flush_rows():
+        writer.flush()
+        formats.flush()
+        # replayed values come from responses fetched earlier: the ledger keeps the
+        # original fetch times (and windows), so unsettled dates are still re-fetched later
+        if not response_cache.is_replay():
+            for day, day_statuses, fetched_at in unflushed:
+                for source_id, status in day_statuses.items():
+                    ledger.record(
+                        source_id, day, status, fetched_at, window_of.get((source_id, day))
+                    )
+            ledger.save()
+        unflushed.clear()
+        norms.save()
+    per_date_plan = {
+        d: [sid for sid in ids if sid not in ranged.get(d, ({}, {}))[1]] for d, ids in plan.items()
+    }
+    # restorable dates without anything to fetch are only projected from the store
+    for d in restorable:
+        per_date_plan.setdefault(d, [])
+    per_date_plan = dict(sorted(per_date_plan.items()))
+
+    # asyncio engine: harvest all planned dates up front on one event loop
+    harvested = None
+    if settings.FETCH_ENGINE == "asyncio" and plan:
+        harvested = asyncio.run(
+            fetch_all_async(
+                sources,
+                per_date_plan,
+                settings.FETCH_MAX_WORKERS,
+                settings.FETCH_CONCURRENCY,
+                settings.HTTP_MAX_PER_HOST,
+                settings.HTTP_POOL_SIZE,
+            )
+        )
+
+    # notes are generated in the background (cached by anomaly set) and written after the rows
+    notes = NoteWriter(
+        settings.OPENAI_API_KEY,
+        settings.OPENAI_MODEL,
+        os.path.join(settings.STATE_DIR, "notes.json"),
+        settings.OPENAI_MAX_CONCURRENCY,
+    )
     anomalies_for_email = []
-    for d in dates:
+    for d, source_ids in per_date_plan.items():
         date_str = d.isoformat()
         # Fetch
-        row_values, _ = fetch_all_for_date(settings, d, sh, ws)
+        if not source_ids:
+            row_values, statuses = {}, {}
+        elif harvested is not None:
+            row_values, statuses = harvested[d]
+        else:
+            row_values, statuses = fetch_all_for_date(
+                sources,
+                d,
+                only=source_ids,
+                max_workers=settings.FETCH_MAX_WORKERS,
+                limits=settings.FETCH_CONCURRENCY,
+            )
+        range_values, range_statuses = ranged.get(d, ({}, {}))
+        row_values = {**range_values, **row_values}
+        statuses = {**range_statuses, **statuses}
+
+        if not row_values and not statuses and d not in restorable:
+            # nothing harvested (e.g. every source missed the replay cache): leave the day as is
+            continue
 
-        # Extend headers if new keys (e.g., new Shopware channels, bank accounts) appeared
-        new_keys = [k for k in row_values.keys() if k not in headers]
-        if new_keys:
-            headers = ["datum"] + sorted(list(set(headers[1:-1] + new_keys))) + ["notizen"]
-            ensure_headers(ws, headers)
+        # Store first; rows missing in the sheet are projected in full from the store
+        store.upsert(d, row_values)
+        if d in missing:
+            row_values = store.row(d)
+        norms.update(d, row_values)
 
-        # Write row
-        row_index = write_row(ws, headers, date_str, row_values)
+        # New keys (e.g., new Shopware channels, bank accounts) are appended as new columns
+        headers = columns.ensure(list(row_values))
 
-        # Anomaly detection (per numeric field)
+        # Stage row (written in batches, see flush_rows)
+        row_index = writer.stage(headers, date_str, row_values)
+        unflushed.append((d, statuses, dt.datetime.now()))
+
+        # Anomaly detection (per numeric field); stale colours of re-written cells are cleared
+        formats.clear(row_index, [headers.index(k) + 1 for k in row_values if k in headers])
         flagged = []
         for k, v in row_values.items():
             if k not in headers:  # if header updated later
@@ -180,40 +386,45 @@ def job_run():
                 continue
             try:
                 val = float(v)
-        except Exception:
-
+            except Exception:
                 val = None
-            hist = compute_history(ws, headers, k)[:-1]  # exclude the just-written value (we'll use prior history)
-            flag, norm = classify(val, [x for x in hist])
+            flag, norm = norms.classify(k, d, val)  # norm over prior dates only
             if flag != "none" and norm is not None:
                 col_idx = headers.index(k) + 1
-                # Color the cell now
-                if flag == "green":
-                    # green
-                    from gspread_formatting import Color
-                    from .sheets import color_cell
-                    color_cell(ws, row_index, col_idx, (0.8, 0.94, 0.8))
-                elif flag == "red":
-                    color_cell(ws, row_index, col_idx, (0.98, 0.8, 0.8))
+                formats.color(row_index, col_idx, GREEN if flag == "green" else RED)
                 flagged.append({"metric": k, "value": val, "norm": norm, "flag": flag})
 
-        # Notes with OpenAI (German)
-        note_text = ""
+        # Notes with OpenAI (German), off the critical path
         if flagged:
-            try:
-                note_text = write_notes(settings.OPENAI_API_KEY, settings.OPENAI_MODEL, date_str, flagged)
-                ws.update_cell(row_index, headers.index("notizen")+1, note_text)
-            except Exception as e:
-                log.exception("OpenAI notes failed: %s", e)
+            notes.submit(date_str, flagged)
+            anomalies_for_email.append((d, row_index, flagged))
 
-        if flagged:
-            anomalies_for_email.append((date_str, flagged, note_text))
+        if len(writer) >= settings.SHEETS_FLUSH_ROWS:
+            flush_rows()
+
+    flush_rows()
+
+    # Numeric rows are in the sheet; now wait for the notes and write them in one batch
+    note_texts = notes.results()
+    notes.close()
+    for d, row_index, _ in anomalies_for_email:
+        note_text = note_texts.get(d.isoformat())
+        if note_text:
+            store.upsert(d, {"notizen": note_text})
+            writer.set_value(headers, row_index, "notizen", note_text)
+    writer.flush()
+    log.info("Notizen: %d geschrieben, %d neu erzeugt", len(note_texts), notes.generated)
+    _log_sheets_quota()
+    store.close()
+    http_pool.close_all()
 
     # Email alert if anomalies or failures indicated as N/A
     if settings.ALERT_EMAIL_TO and settings.ALERT_EMAIL_FROM and settings.SMTP_HOST:
         try:
             body_lines = []
-            for (date_str, fl, note) in anomalies_for_email:
+            for (d, _, fl) in anomalies_for_email:
+                date_str = d.isoformat()
+                note = note_texts.get(date_str, "")
                 body_lines.append(f"[{date_str}] {len(fl)} Auffälligkeiten")
                 if note:
                     body_lines.append(note)
@@ -228,6 +439,57 @@ def job_run():
         except Exception as e:
             log.exception("Email alert failed: %s", e)
 
+def job_reclassify():
+    """Recolour every row of the sheet from the metric store in one vectorized pass.
+
+    For backfills and after threshold changes: norms and flags of all dates are
+    computed over the whole dates x metrics matrix instead of cell by cell.
+    Nothing is fetched and no notes are written.
+    """
+    load_dotenv(".env")
+    settings = Settings()
+    sheets_quota.configure(settings.SHEETS_REQUESTS_PER_MINUTE)
+    sh, ws = get_sheet(
+        settings.GOOGLE_SPREADSHEET_ID,
+        settings.GOOGLE_SHEET_TAB,
+        settings.GOOGLE_SERVICE_ACCOUNT_JSON,
+        settings.GOOGLE_SERVICE_ACCOUNT_FILE,
+    )
+    snapshot = WorksheetSnapshot.load(sh, ws)
+    metrics = [h for h in snapshot.headers if h and h not in ("datum", "notizen")]
+    with MetricStore(os.path.join(settings.STATE_DIR, "metrics.sqlite3")) as store:
+        dates, values = store.matrix(metrics)
+    flags, _ = classify_matrix(values)
+    cols = [snapshot.col_for(m) for m in metrics]
+
+    formats = FormatQueue(sh, ws)
+    recoloured = 0
+    for i, d in enumerate(dates):
+        row_index = snapshot.row_for(d.isoformat())
+        if row_index is None:
+            continue
+        formats.clear(row_index, cols)
+        for j, flag in enumerate(flags[i]):
+            if flag != "none":
+                formats.color(row_index, cols[j], GREEN if flag == "green" else RED)
+        recoloured += 1
+        if len(formats) >= 500:
+            formats.flush()
+    formats.flush()
+    log.info("Anomalien neu eingefärbt: %d Zeilen, %d Kennzahlen", recoloured, len(metrics))
+    _log_sheets_quota()
+
+
+def _log_sheets_quota():
+    stats = sheets_quota.stats()
+    log.info(
+        "Sheets-API: %d Anfragen, %d Wiederholungen nach 429, %.1f s gewartet",
+        stats["requests"],
+        stats["retries"],
+        stats["waited_seconds"],
+    )
+
+
 def run_forever():
     load_dotenv(".env")
     settings = Settings()
@@ -250,4 +512,7 @@ def run_forever():
         scheduler.shutdown()
 
 if __name__ == "__main__":
-    run_forever()
+    if "--reclassify" in sys.argv[1:]:
+        job_reclassify()
+    else:
+        run_forever()
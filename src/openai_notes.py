@@ -1,17 +1,36 @@
 from __future__ import annotations
 
+import functools
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
 from openai import OpenAI
 
 SYSTEM = (
     "Du bist ein analytischer Assistent. "
     "Schreibe kurze, klare, deutschsprachige Stichpunkte zu betriebswirtschaftlichen Auffälligkeiten."
 )
+# cached notes kept at most; the oldest entries are dropped first
+CACHE_MAX_ENTRIES = 5000
+
+log = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=4)
+def _client(api_key: str) -> OpenAI:
+    # one client (and connection pool) per key for the whole process
+    return OpenAI(api_key=api_key)
 
 
 def write_notes(api_key: str, model: str, date_str: str, anomalies: list[dict]) -> str:
     if not anomalies:
         return ""
-    client = OpenAI(api_key=api_key)
+    client = _client(api_key)
     bullet_points = []
     for a in anomalies:
         metric = a.get("metric")
@@ -38,3 +57,83 @@ def write_notes(api_key: str, model: str, date_str: str, anomalies: list[dict])
         max_tokens=150,
     )
     return resp.choices[0].message.content.strip()
+
+
+def anomaly_key(model: str, date_str: str, anomalies: list[dict]) -> str:
+    """Hash of everything that goes into the prompt, so identical anomaly sets share a note."""
+    items = sorted(
+        (
+            a.get("metric"),
+            a.get("flag"),
+            round(a.get("value") or 0, 2),
+            round(a.get("norm") or 0, 2),
+        )
+        for a in anomalies
+    )
+    blob = json.dumps([model, date_str, items], default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class NoteWriter:
+    """Generates notes in the background while the harvest goes on.
+
+    `submit` returns immediately; at most `max_workers` completions run at once.
+    Notes are cached at `path` (JSON, keyed by `anomaly_key`) so re-runs over the
+    same anomalies do not ask the model again. `results` waits for all of them.
+    """
+
+    def __init__(
+        self, api_key: str, model: str, path: str | os.PathLike[str], max_workers: int = 4
+    ):
+        self.api_key = api_key
+        self.model = model
+        self.path = pathlib.Path(path)
+        self._cache: dict[str, str] = {}
+        if self.path.exists():
+            self._cache = json.loads(self.path.read_text(encoding="utf-8") or "{}")
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_workers))
+        self._pending: dict[str, Future[str]] = {}
+        self.generated = 0
+
+    def submit(self, date_str: str, anomalies: list[dict]) -> None:
+        key = anomaly_key(self.model, date_str, anomalies)
+        with self._lock:
+            note = self._cache.get(key)
+        if note is not None:
+            done: Future[str] = Future()
+            done.set_result(note)
+            self._pending[date_str] = done
+            return
+        self._pending[date_str] = self._pool.submit(self._generate, key, date_str, anomalies)
+
+    def _generate(self, key: str, date_str: str, anomalies: list[dict]) -> str:
+        note = write_notes(self.api_key, self.model, date_str, anomalies)
+        with self._lock:
+            self._cache[key] = note
+            self.generated += 1
+        return note
+
+    def results(self) -> dict[str, str]:
+        """Wait for all submitted notes; dates whose note failed are left out."""
+        out: dict[str, str] = {}
+        for date_str, fut in self._pending.items():
+            try:
+                out[date_str] = fut.result()
+            except Exception as e:
+                log.exception("OpenAI notes failed for %s: %s", date_str, e)
+        self._pending.clear()
+        self._save()
+        return out
+
+    def _save(self) -> None:
+        with self._lock:
+            for key in list(self._cache)[: max(0, len(self._cache) - CACHE_MAX_ENTRIES)]:
+                del self._cache[key]
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+            tmp.write_text(json.dumps(self._cache), encoding="utf-8")
+            os.replace(tmp, self.path)
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
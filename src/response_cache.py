@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Iterator
+from typing import IO, Any
+
+# responses older than this are fetched again (unless configured per source);
+# below a day so the nightly run always sees fresh data
+DEFAULT_TTL = 20 * 3600
+
+_lock = threading.RLock()
+_dir: pathlib.Path | None = None
+_ttls: dict[str, int] = {}
+_max_bytes = 0
+_replay = False
+# cache file -> size in bytes, least recently used first
+_index: OrderedDict[pathlib.Path, int] = OrderedDict()
+_total = 0
+_MISS = object()
+
+
+class ResponseCacheMiss(BaseException):
+    """Raised in replay mode when a response is not in the cache.
+
+    Like `asyncio.CancelledError` it derives from BaseException, so the fetchers'
+    ``except Exception`` fallbacks (which turn errors into N/A) and their retries let
+    it through: a miss means "no data for this source and day", never a value.
+    """
+
+
+def configure(
+    directory: str | os.PathLike[str] | None,
+    max_bytes: int,
+    ttls: dict[str, int] | None = None,
+    replay: bool = False,
+) -> None:
+    """Cache raw responses under `directory`, evicting least recently used entries
+    beyond `max_bytes`. `ttls` maps a source (e.g. ``shopware6``) to seconds.
+
+    In replay mode entries never expire and nothing is fetched: a miss raises
+    `ResponseCacheMiss`. Without a directory (or budget) the cache is off.
+    """
+    global _dir, _ttls, _max_bytes, _replay, _total
+    with _lock:
+        _dir = pathlib.Path(directory) if directory and max_bytes > 0 else None
+        _ttls = dict(ttls or {})
+        _max_bytes = max_bytes
+        _replay = replay
+        _index.clear()
+        _total = 0
+        if _dir is None:
+            return
+        _dir.mkdir(parents=True, exist_ok=True)
+        # access time records the last use (set explicitly on every hit)
+        entries = [(p.stat(), p) for p in _dir.glob("*/*") if not p.name.endswith(".tmp")]
+        for st, p in sorted(entries, key=lambda e: e[0].st_atime):
+            _index[p] = st.st_size
+            _total += st.st_size
+
+
+def is_replay() -> bool:
+    return _replay
+
+
+def _path(source: str, account: str, endpoint: str, params: Any, suffix: str) -> pathlib.Path:
+    # content-addressed: the key is a hash of (source, account, endpoint, params)
+    blob = json.dumps([source, account, endpoint, params], sort_keys=True, default=str)
+    key = hashlib.sha256(blob.encode("utf-8")).hexdigest()
+    assert _dir is not None
+    return _dir / key[:2] / f"{key}{suffix}"
+
+
+def _fresh(source: str, path: pathlib.Path) -> bool:
+    try:
+        stored_at = path.stat().st_mtime
+    except FileNotFoundError:
+        return False
+    return _replay or time.time() - stored_at < _ttls.get(source, DEFAULT_TTL)
+
+
+def _touch(path: pathlib.Path) -> None:
+    # mtime keeps the store time for the TTL, atime the last use for LRU
+    with _lock:
+        os.utime(path, (time.time(), path.stat().st_mtime))
+        if path in _index:
+            _index.move_to_end(path)
+
+
+def _tmp_for(path: pathlib.Path) -> pathlib.Path:
+    # per-thread temp name so concurrent writers of the same key do not collide
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+
+
+def _commit(tmp: pathlib.Path, path: pathlib.Path) -> None:
+    global _total
+    os.replace(tmp, path)
+    size = path.stat().st_size
+    with _lock:
+        _total += size - _index.pop(path, 0)
+        _index[path] = size
+        while _total > _max_bytes and len(_index) > 1:
+            oldest, oldest_size = _index.popitem(last=False)
+            with contextlib.suppress(FileNotFoundError):
+                oldest.unlink()
+            _total -= oldest_size
+
+
+def _read_json(source: str, path: pathlib.Path, what: str) -> Any:
+    if _fresh(source, path):
+        try:
+            value = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            value = _MISS
+        if value is not _MISS:
+            _touch(path)
+            return value
+    if _replay:
+        raise ResponseCacheMiss(what)
+    return _MISS
+
+
+def _write_json(path: pathlib.Path, value: Any) -> None:
+    tmp = _tmp_for(path)
+    tmp.write_text(json.dumps(value), encoding="utf-8")
+    _commit(tmp, path)
+
+
+def cached_json(
+    source: str, account: str, endpoint: str, params: Any, fetch: Callable[[], Any]
+) -> Any:
+    """Return the cached JSON response for the key, or `fetch()` it and store it."""
+    if _dir is None:
+        return fetch()
+    path = _path(source, account, endpoint, params, ".json")
+    value = _read_json(source, path, f"{source}:{account} {endpoint}")
+    if value is _MISS:
+        value = fetch()
+        _write_json(path, value)
+    return value
+
+
+async def acached_json(
+    source: str, account: str, endpoint: str, params: Any, fetch: Callable[[], Awaitable[Any]]
+) -> Any:
+    """asyncio variant of `cached_json`."""
+    if _dir is None:
+        return await fetch()
+    path = _path(source, account, endpoint, params, ".json")
+    value = _read_json(source, path, f"{source}:{account} {endpoint}")
+    if value is _MISS:
+        value = await fetch()
+        _write_json(path, value)
+    return value
+
+
+@contextlib.contextmanager
+def cached_file(
+    source: str,
+    account: str,
+    endpoint: str,
+    params: Any,
+    download: Callable[[IO[bytes]], None],
+) -> Iterator[IO[bytes]]:
+    """Open a cached raw document for reading, calling `download(fileobj)` on a miss.
+
+    For large documents (e.g. report files) that are streamed to disk rather than
+    held in memory. Without a cache the download goes to a temporary file.
+    """
+    if _dir is None:
+        with tempfile.TemporaryFile() as f:
+            download(f)
+            f.seek(0)
+            yield f
+        return
+    path = _path(source, account, endpoint, params, ".bin")
+    if _fresh(source, path):
+        _touch(path)
+    elif _replay:
+        raise ResponseCacheMiss(f"{source}:{account} {endpoint}")
+    else:
+        tmp = _tmp_for(path)
+        try:
+            with open(tmp, "wb") as f:
+                download(f)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        _commit(tmp, path)
+    with open(path, "rb") as f:
+        yield f
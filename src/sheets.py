@@ -1,17 +1,26 @@
 from __future__ import annotations
 
+import datetime as dt
 import json
 from typing import Any
 
 import gspread
 from google.oauth2.service_account import Credentials
-from gspread_formatting import CellFormat, Color, format_cell_range
+
+from .util import sheets_quota
 
 SCOPE = [
     "https://www.googleapis.com/auth/spreadsheets",
     "https://www.googleapis.com/auth/drive",
 ]
 
+# Background colours for anomaly flags
+GREEN = (0.8, 0.94, 0.8)
+RED = (0.98, 0.8, 0.8)
+
+# Day zero of Sheets serial dates (UNFORMATTED_VALUE returns dates as numbers)
+SHEETS_EPOCH = dt.date(1899, 12, 30)
+
 
 def _creds_from_env(service_account_json: str | None, service_account_file: str | None):
     if service_account_json:
@@ -35,54 +44,304 @@ def get_sheet(
 ):
     creds = _creds_from_env(service_account_json, service_account_file)
     gc = gspread.authorize(creds)
-    sh = gc.open_by_key(spreadsheet_id)
+    sh = sheets_quota.call(gc.open_by_key, spreadsheet_id)
     try:
-        ws = sh.worksheet(worksheet_title)
+        ws = sheets_quota.call(sh.worksheet, worksheet_title)
     except gspread.exceptions.WorksheetNotFound:
-        ws = sh.add_worksheet(title=worksheet_title, rows=2000, cols=200)
+        ws = sheets_quota.call(sh.add_worksheet, title=worksheet_title, rows=2000, cols=200)
     return sh, ws
 
 
-def ensure_headers(ws, headers: list[str]):
-    existing = ws.row_values(1)
-    if existing == headers:
-        return
-    # Rewrite headers (row 1)
-    ws.resize(rows=max(ws.row_count, 2), cols=max(len(headers), ws.col_count))
-    ws.update([headers], "A1")
-    # Freeze header row
-    ws.freeze(rows=1)
-
-
-def find_row_by_date(ws, date_str: str) -> int | None:
-    col1 = ws.col_values(1)
-    for i, v in enumerate(col1, start=1):
-        if v == date_str:
-            return i
-    return None
-
-
-def write_row(ws, headers: list[str], date_str: str, row_data: dict[str, Any]):
-    # Find or append row
-    row_idx = find_row_by_date(ws, date_str)
-    if row_idx is None:
-        # append
-        existing_values = ws.get_all_values()
-        row_idx = len(existing_values) + 1
-        ws.update_cell(row_idx, 1, date_str)
-    # write values
-    for k, v in row_data.items():
+def _cell_to_date_str(v: Any) -> str:
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        return (SHEETS_EPOCH + dt.timedelta(days=int(v))).isoformat()
+    return str(v)
+
+
+class WorksheetSnapshot:
+    """In-memory copy of the worksheet, loaded with a single batchGet per run.
+
+    Exposes the header row and a date -> row index. `RowWriter` and `ColumnRegistry`
+    stage their changes here first, so row lookups need no API calls and flushed
+    ranges are built from it. Row and column indices are 1-based like in gspread.
+    """
+
+    def __init__(self, values: list[list[Any]]):
+        self._values: list[list[Any]] = [list(r) for r in values] or [[]]
+        self.headers: list[str] = [str(h) for h in self._values[0]]
+        self._col_index = {h: i for i, h in enumerate(self.headers, start=1) if h}
+        self._row_index: dict[str, int] = {}
+        for i, r in enumerate(self._values[1:], start=2):
+            if r and r[0] not in (None, ""):
+                self._row_index.setdefault(_cell_to_date_str(r[0]), i)
+
+    @classmethod
+    def load(cls, sh, ws) -> WorksheetSnapshot:
+        resp = sheets_quota.call(
+            sh.values_batch_get,
+            [gspread.utils.absolute_range_name(ws.title)],
+            params={"valueRenderOption": "UNFORMATTED_VALUE"},
+        )
+        ranges = resp.get("valueRanges") or [{}]
+        return cls(ranges[0].get("values") or [])
+
+    def set_headers(self, headers: list[str]) -> None:
+        self.headers = list(headers)
+        self._values[0] = list(headers)
+        self._col_index = {h: i for i, h in enumerate(self.headers, start=1) if h}
+
+    def col_for(self, key: str) -> int | None:
+        return self._col_index.get(key)
+
+    def row_for(self, date_str: str) -> int | None:
+        return self._row_index.get(date_str)
+
+    def next_row(self) -> int:
+        return len(self._values) + 1
+
+    def dates(self) -> set[str]:
+        return set(self._row_index)
+
+    def value(self, row: int, col: int) -> Any:
+        if row - 1 >= len(self._values):
+            return ""
+        r = self._values[row - 1]
+        return r[col - 1] if col - 1 < len(r) else ""
+
+    def set_cell(self, row: int, col: int, value: Any) -> None:
+        while len(self._values) < row:
+            self._values.append([])
+        r = self._values[row - 1]
+        if len(r) < col:
+            r.extend([""] * (col - len(r)))
+        r[col - 1] = value
+        if row > 1 and col == 1 and value not in (None, ""):
+            self._row_index.setdefault(_cell_to_date_str(value), row)
+
+
+class ColumnRegistry:
+    """Append-only column layout of the worksheet, persisted in a hidden tab.
+
+    The tab lists one key per row in column order (row n = column n of the data
+    sheet). Keys are never re-sorted or removed: new metrics are appended after the
+    last column, only their header cells are written, and the grid grows in steps
+    of `COL_GROWTH` columns, so existing column positions never change.
+    """
+
+    TAB = "_spalten"
+    # extra columns added when the grid runs out
+    COL_GROWTH = 50
+
+    def __init__(self, ws, tab, snapshot: WorksheetSnapshot, keys: list[str]):
+        self.ws = ws
+        self.tab = tab
+        self.snapshot = snapshot
+        self.headers: list[str] = list(keys)
+        self._known = set(keys)
+
+    @classmethod
+    def load(cls, sh, ws, snapshot: WorksheetSnapshot) -> ColumnRegistry:
+        """Read the registry tab (created hidden on first use).
+
+        Without a registry the current header row is adopted as the initial layout.
+        """
         try:
-            col_idx = headers.index(k) + 1
-        except ValueError:
-            continue
-        ws.update_cell(row_idx, col_idx, v if v is not None else "N/A")
-    return row_idx
-
-
-def color_cell(ws, row: int, col: int, rgb: tuple[float, float, float] | None):
-    if rgb is None:
-        return
-    cf = CellFormat(backgroundColor=Color(red=rgb[0], green=rgb[1], blue=rgb[2]))
-    a1 = gspread.utils.rowcol_to_a1(row, col)
-    format_cell_range(ws, a1, cf)
+            tab = sheets_quota.call(sh.worksheet, cls.TAB)
+            rows = sheets_quota.call(tab.get_values, "A:A")
+            keys = _strip_trailing([str(r[0]) if r else "" for r in rows])
+        except gspread.exceptions.WorksheetNotFound:
+            tab = sheets_quota.call(sh.add_worksheet, title=cls.TAB, rows=500, cols=1)
+            sheets_quota.call(tab.hide)
+            keys = []
+        registry = cls(ws, tab, snapshot, [])
+        # blank header cells keep their position so no column moves
+        adopt = _strip_trailing(snapshot.headers)
+        if keys:
+            registry.headers, registry._known = keys, set(keys) - {""}
+            if snapshot.headers[: len(keys)] != keys:
+                # header row edited or lost: restore it from the registry
+                registry._write_headers(1, keys)
+        elif adopt:
+            registry.headers, registry._known = adopt, set(adopt) - {""}
+            registry._register(1, adopt)
+        snapshot.set_headers(registry.headers)
+        return registry
+
+    def ensure(self, keys: list[str]) -> list[str]:
+        """Append unknown `keys` as new columns (in the given order); returns all headers."""
+        new = [k for k in dict.fromkeys(keys) if k and k not in self._known]
+        if not new:
+            return self.headers
+        start = len(self.headers) + 1
+        self.headers = self.headers + new
+        self._known.update(new)
+        self._write_headers(start, new)
+        self._register(start, new)
+        self.snapshot.set_headers(self.headers)
+        return self.headers
+
+    def _write_headers(self, start: int, keys: list[str]) -> None:
+        end = start + len(keys) - 1
+        if end > self.ws.col_count or self.ws.row_count < 2:
+            sheets_quota.call(
+                self.ws.resize,
+                rows=max(self.ws.row_count, 2),
+                cols=max(self.ws.col_count, end + self.COL_GROWTH),
+            )
+        first = gspread.utils.rowcol_to_a1(1, start)
+        last = gspread.utils.rowcol_to_a1(1, end)
+        sheets_quota.call(self.ws.update, [keys], f"{first}:{last}")
+        if start == 1 and self.ws.frozen_row_count != 1:
+            sheets_quota.call(self.ws.freeze, rows=1)
+
+    def _register(self, start: int, keys: list[str]) -> None:
+        end = start + len(keys) - 1
+        if end > self.tab.row_count:
+            sheets_quota.call(self.tab.add_rows, end - self.tab.row_count + 500)
+        sheets_quota.call(self.tab.update, [[k] for k in keys], f"A{start}:A{end}")
+
+
+def _strip_trailing(keys: list[str]) -> list[str]:
+    keys = list(keys)
+    while keys and not keys[-1]:
+        keys.pop()
+    return keys
+
+
+class RowWriter:
+    """Stages whole rows in the snapshot and flushes them with one values.batchUpdate.
+
+    Each staged row is written as a full A:<last column> range (date, metrics and
+    notes together); contiguous rows are coalesced into a single range, so a
+    backfill of many dates costs one request instead of one per cell.
+    """
+
+    # extra rows added when an append runs past the grid
+    ROW_GROWTH = 500
+
+    def __init__(self, ws, snapshot: WorksheetSnapshot):
+        self.ws = ws
+        self.snapshot = snapshot
+        self._pending: set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def stage(self, headers: list[str], date_str: str, row_data: dict[str, Any]) -> int:
+        row_idx = self.snapshot.row_for(date_str)
+        if row_idx is None:
+            row_idx = self.snapshot.next_row()
+        if row_idx > self.ws.row_count:
+            # grow the grid up front so formatting can target the row before it is flushed
+            sheets_quota.call(self.ws.add_rows, row_idx - self.ws.row_count + self.ROW_GROWTH)
+        self.snapshot.set_cell(row_idx, 1, date_str)
+        for k, v in row_data.items():
+            try:
+                col_idx = headers.index(k) + 1
+            except ValueError:
+                continue
+            self.snapshot.set_cell(row_idx, col_idx, v if v is not None else "N/A")
+        self._pending.add(row_idx)
+        return row_idx
+
+    def set_value(self, headers: list[str], row_idx: int, key: str, value: Any) -> None:
+        self.snapshot.set_cell(row_idx, headers.index(key) + 1, value)
+        self._pending.add(row_idx)
+
+    def _ranges(self) -> list[dict[str, Any]]:
+        width = len(self.snapshot.headers)
+        data: list[dict[str, Any]] = []
+        rows = sorted(self._pending)
+        start = prev = rows[0]
+        for r in rows[1:] + [None]:
+            if r is not None and r == prev + 1:
+                prev = r
+                continue
+            values = []
+            for i in range(start, prev + 1):
+                values.append([self.snapshot.value(i, c) for c in range(1, width + 1)])
+            end = gspread.utils.rowcol_to_a1(prev, width)
+            data.append({"range": f"A{start}:{end}", "values": values})
+            if r is not None:
+                start = prev = r
+        return data
+
+    def flush(self) -> int:
+        """Write all staged rows; returns the number of rows written."""
+        if not self._pending:
+            return 0
+        sheets_quota.call(self.ws.batch_update, self._ranges(), value_input_option="USER_ENTERED")
+        written = len(self._pending)
+        self._pending.clear()
+        return written
+
+
+class FormatQueue:
+    """Collects background colourings and applies them in one spreadsheets.batchUpdate.
+
+    Requests are sent in queue order, so clearing a re-written row before colouring
+    its flagged cells leaves only the current flags visible.
+    """
+
+    def __init__(self, sh, ws):
+        self.sh = sh
+        self.ws = ws
+        self._requests: list[dict[str, Any]] = []
+
+    def __len__(self) -> int:
+        return len(self._requests)
+
+    def _repeat_cell(self, row: int, col_start: int, col_end: int, color: dict | None):
+        fmt = {"backgroundColor": color} if color is not None else {}
+        self._requests.append(
+            {
+                "repeatCell": {
+                    "range": {
+                        "sheetId": self.ws.id,
+                        "startRowIndex": row - 1,
+                        "endRowIndex": row,
+                        "startColumnIndex": col_start - 1,
+                        "endColumnIndex": col_end,
+                    },
+                    "cell": {"userEnteredFormat": fmt},
+                    "fields": "userEnteredFormat.backgroundColor",
+                }
+            }
+        )
+
+    def clear(self, row: int, cols: list[int]) -> None:
+        """Reset the background of the given cells; adjacent columns share one range."""
+        cols = sorted(set(cols))
+        if not cols:
+            return
+        start = prev = cols[0]
+        for c in cols[1:] + [None]:
+            if c is not None and c == prev + 1:
+                prev = c
+                continue
+            self._repeat_cell(row, start, prev, None)
+            if c is not None:
+                start = prev = c
+
+    def color(self, row: int, col: int, rgb: tuple[float, float, float]) -> None:
+        """Colour one cell; a same-coloured cell just left of it in the queue is extended."""
+        color = {"red": rgb[0], "green": rgb[1], "blue": rgb[2]}
+        last = self._requests[-1]["repeatCell"] if self._requests else None
+        if (
+            last is not None
+            and last["cell"]["userEnteredFormat"].get("backgroundColor") == color
+            and last["range"]["startRowIndex"] == row - 1
+            and last["range"]["endColumnIndex"] == col - 1
+        ):
+            last["range"]["endColumnIndex"] = col
+            return
+        self._repeat_cell(row, col, col, color)
+
+    def flush(self) -> int:
+        """Send all queued requests; returns how many were applied."""
+        if not self._requests:
+            return 0
+        sheets_quota.call(self.sh.batch_update, {"requests": self._requests})
+        applied = len(self._requests)
+        self._requests = []
+        return applied
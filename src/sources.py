@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import datetime as dt
+import weakref
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from typing import Any
+
+from .config import Settings, ShopwareInstance
+from .fetchers.amazon import fetch_amazon_daily, fetch_amazon_range
+from .fetchers.ebay import fetch_ebay_daily, fetch_ebay_daily_async, fetch_ebay_range
+from .fetchers.getmyinvoices import (
+    GetMyInvoicesClient,
+    fetch_gmi_bank_balances_eod,
+    fetch_gmi_bank_balances_eod_async,
+    fetch_gmi_bank_balances_range,
+)
+from .fetchers.google_ads import fetch_google_ads_daily, fetch_google_ads_range
+from .fetchers.shopware6 import (
+    AsyncShopware6Client,
+    Shopware6Client,
+    fetch_shopware_daily,
+    fetch_shopware_daily_async,
+    fetch_shopware_range,
+)
+from .fetchers.tiktok_shop import fetch_tiktok_daily, fetch_tiktok_daily_async, fetch_tiktok_range
+from .util.async_http import AsyncHttp
+
+AsyncFetch = Callable[[dt.date, AsyncHttp], Awaitable[dict[str, Any]]]
+RangeFetch = Callable[[dt.date, dt.date], dict[dt.date, dict[str, Any]]]
+
+
+@dataclass(frozen=True)
+class Source:
+    """One harvestable unit: a source/account pair that yields column values per date.
+
+    `id` is stable across runs (e.g. ``amazon:EU``) and keys the harvest ledger.
+    `afetch` is the asyncio variant used by the async engine; sources without one
+    run their blocking `fetch` in a worker thread there. `fetch_range(first, last)`
+    returns {date: values} for a whole window and is preferred for backfills.
+    """
+
+    id: str
+    fetch: Callable[[dt.date], dict[str, Any]]
+    afetch: AsyncFetch | None = None
+    fetch_range: RangeFetch | None = None
+
+    @property
+    def group(self) -> str:
+        """Provider part of the id (``amazon:EU`` -> ``amazon``), used for concurrency limits."""
+        return self.id.split(":", 1)[0]
+
+
+def google_ads_customer_ids(settings: Settings) -> list[str]:
+    if not settings.GOOGLE_ADS_CUSTOMER_IDS:
+        return []
+    return [c.strip() for c in settings.GOOGLE_ADS_CUSTOMER_IDS.split(",") if c.strip()]
+
+
+def _shopware_afetch(inst: ShopwareInstance) -> AsyncFetch:
+    # one async client (and token) per AsyncHttp, i.e. per run
+    clients: weakref.WeakKeyDictionary[AsyncHttp, AsyncShopware6Client] = (
+        weakref.WeakKeyDictionary()
+    )
+
+    def afetch(d: dt.date, http: AsyncHttp) -> Awaitable[dict[str, Any]]:
+        client = clients.get(http)
+        if client is None:
+            client = clients[http] = AsyncShopware6Client(
+                inst.name, inst.base_url, inst.client_id, inst.client_secret, http
+            )
+        return fetch_shopware_daily_async(client, d)
+
+    return afetch
+
+
+def build_sources(settings: Settings) -> list[Source]:
+    sources: list[Source] = []
+
+    # 1) Shopware (one client per instance, reused across dates)
+    for inst in settings.SHOPWARE6_INSTANCES:
+        client = Shopware6Client(inst.name, inst.base_url, inst.client_id, inst.client_secret)
+        sources.append(
+            Source(
+                f"shopware6:{inst.name}",
+                lambda d, c=client: fetch_shopware_daily(c, d),
+                _shopware_afetch(inst),
+                lambda first, last, c=client: fetch_shopware_range(c, first, last),
+            )
+        )
+
+    # 2) GetMyInvoices (account list cached for the run)
+    if settings.GETMYINVOICES_API_KEY:
+        gmi = GetMyInvoicesClient(settings.GETMYINVOICES_API_KEY, settings.HTTP_MAX_PER_HOST)
+        sources.append(
+            Source(
+                "getmyinvoices",
+                lambda d: fetch_gmi_bank_balances_eod(gmi, d),
+                lambda d, http: fetch_gmi_bank_balances_eod_async(gmi, d, http),
+                lambda first, last: fetch_gmi_bank_balances_range(gmi, first, last),
+            )
+        )
+
+    # 3) Google Ads
+    customer_ids = google_ads_customer_ids(settings)
+    if (
+        settings.GOOGLE_ADS_DEVELOPER_TOKEN
+        and settings.GOOGLE_ADS_CLIENT_ID
+        and settings.GOOGLE_ADS_CLIENT_SECRET
+        and settings.GOOGLE_ADS_REFRESH_TOKEN
+        and customer_ids
+    ):
+        creds = (
+            settings.GOOGLE_ADS_DEVELOPER_TOKEN,
+            settings.GOOGLE_ADS_CLIENT_ID,
+            settings.GOOGLE_ADS_CLIENT_SECRET,
+            settings.GOOGLE_ADS_REFRESH_TOKEN,
+        )
+        sources.append(
+            Source(
+                "google_ads",
+                lambda d: fetch_google_ads_daily(*creds, customer_ids, d),
+                fetch_range=lambda first, last: fetch_google_ads_range(
+                    *creds, customer_ids, first, last
+                ),
+            )
+        )
+
+    # 4) Amazon
+    for acc in settings.AMAZON_ACCOUNTS:
+        account = acc.model_dump()
+        sources.append(
+            Source(
+                f"amazon:{acc.name}",
+                lambda d, a=account: fetch_amazon_daily(a, d),
+                fetch_range=lambda first, last, a=account: fetch_amazon_range(a, first, last),
+            )
+        )
+
+    # 5) eBay
+    for acc in settings.EBAY_ACCOUNTS:
+        account = acc.model_dump()
+        sources.append(
+            Source(
+                f"ebay:{acc.name}",
+                lambda d, a=account: fetch_ebay_daily(a, d),
+                lambda d, http, a=account: fetch_ebay_daily_async(a, d, http),
+                lambda first, last, a=account: fetch_ebay_range(a, first, last),
+            )
+        )
+
+    # 6) TikTok Shop
+    for shop in settings.TIKTOK_SHOPS:
+        account = shop.model_dump()
+        sources.append(
+            Source(
+                f"tiktok:{shop.name}",
+                lambda d, a=account: fetch_tiktok_daily(a, d),
+                lambda d, http, a=account: fetch_tiktok_daily_async(a, d, http),
+                lambda first, last, a=account: fetch_tiktok_range(a, first, last),
+            )
+        )
+
+    return sources
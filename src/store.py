@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import datetime as dt
+import os
+import pathlib
+import sqlite3
+from collections.abc import Iterator
+from typing import Any
+
+import numpy as np
+
+from .sheets import WorksheetSnapshot
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metrics (
+    metric TEXT NOT NULL,
+    date TEXT NOT NULL,
+    value,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (metric, date)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS metrics_by_date ON metrics (date);
+"""
+
+
+def _normalize(value: Any) -> Any:
+    # numbers are stored as REAL, everything else (N/A, notes) as TEXT
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, (int, float)):
+        return float(value)
+    return str(value)
+
+
+class MetricStore:
+    """Local system of record: one row per (metric, date), kept in SQLite.
+
+    Every fetch is written here first; the sheet is a projection of it. History
+    for anomaly norms is read from here instead of the sheet. The primary key
+    indexes metric then date; a second index serves whole-date reads.
+    """
+
+    def __init__(self, path: str | os.PathLike[str]):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self) -> MetricStore:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def is_empty(self) -> bool:
+        return self._conn.execute("SELECT 1 FROM metrics LIMIT 1").fetchone() is None
+
+    def upsert(self, date: dt.date, values: dict[str, Any]) -> None:
+        """Store the values of one date (None values are skipped) and commit."""
+        now = dt.datetime.now().isoformat(timespec="seconds")
+        rows = [
+            (metric, date.isoformat(), _normalize(v), now)
+            for metric, v in values.items()
+            if v is not None and metric != "datum"
+        ]
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO metrics (metric, date, value, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (metric, date) DO UPDATE SET "
+                "value = excluded.value, updated_at = excluded.updated_at",
+                rows,
+            )
+
+    def has_date(self, date: dt.date) -> bool:
+        row = self._conn.execute(
+            "SELECT 1 FROM metrics WHERE date = ? LIMIT 1", (date.isoformat(),)
+        ).fetchone()
+        return row is not None
+
+    def row(self, date: dt.date) -> dict[str, Any]:
+        """All stored metrics of one date, as written to the sheet."""
+        return dict(
+            self._conn.execute(
+                "SELECT metric, value FROM metrics WHERE date = ?", (date.isoformat(),)
+            ).fetchall()
+        )
+
+    def matrix(self, metrics: list[str]) -> tuple[list[dt.date], np.ndarray]:
+        """All stored dates (oldest first) and a dates x metrics float matrix, NaN for N/A."""
+        dates = [
+            dt.date.fromisoformat(d)
+            for (d,) in self._conn.execute("SELECT DISTINCT date FROM metrics ORDER BY date")
+        ]
+        row_of = {d.isoformat(): i for i, d in enumerate(dates)}
+        col_of = {m: j for j, m in enumerate(metrics)}
+        out = np.full((len(dates), len(metrics)), np.nan)
+        for metric, date, value in self._conn.execute(
+            "SELECT metric, date, value FROM metrics WHERE typeof(value) IN ('integer', 'real')"
+        ):
+            j = col_of.get(metric)
+            if j is not None:
+                out[row_of[date], j] = value
+        return dates, out
+
+    def numeric_rows(self) -> Iterator[tuple[str, dt.date, float]]:
+        """All numeric (metric, date, value) rows, e.g. to seed the norm engine."""
+        for metric, date, value in self._conn.execute(
+            "SELECT metric, date, value FROM metrics WHERE typeof(value) IN ('integer', 'real')"
+        ):
+            yield metric, dt.date.fromisoformat(date), value
+
+    def import_snapshot(self, snapshot: WorksheetSnapshot) -> int:
+        """Seed the store from the sheet (first run with a store); returns the dates imported."""
+        headers = snapshot.headers
+        count = 0
+        for date_str in sorted(snapshot.dates()):
+            try:
+                date = dt.date.fromisoformat(date_str)
+            except ValueError:
+                continue
+            row = snapshot.row_for(date_str)
+            values = {
+                h: snapshot.value(row, col)
+                for col, h in enumerate(headers, start=1)
+                if h and h != "datum" and snapshot.value(row, col) not in (None, "")
+            }
+            self.upsert(date, values)
+            count += 1
+        return count
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import pathlib
+import threading
+import time
+import weakref
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+# refresh this many seconds before the provider-reported expiry
+EXPIRY_SKEW = 120
+
+_lock = threading.RLock()
+_refresh_locks: dict[str, threading.Lock] = {}
+# asyncio locks are bound to their event loop, so they are kept per running loop
+_async_refresh_locks: weakref.WeakKeyDictionary[
+    asyncio.AbstractEventLoop, dict[str, asyncio.Lock]
+] = weakref.WeakKeyDictionary()
+_path: pathlib.Path | None = None
+_entries: dict[str, dict[str, Any]] = {}
+
+
+def _key(provider: str, account: str) -> str:
+    return f"{provider}:{account}"
+
+
+def configure(path: str | os.PathLike[str]) -> None:
+    """Persist tokens at `path` (mode 0600) and load what is still there.
+
+    Without this call the cache only lives in memory for the current process.
+    """
+    global _path, _entries
+    with _lock:
+        _path = pathlib.Path(path)
+        _entries = {}
+        if _path.exists():
+            # expired entries stay: they may still carry a rotated refresh token
+            _entries = json.loads(_path.read_text(encoding="utf-8") or "{}")
+
+
+def _save() -> None:
+    if _path is None:
+        return
+    _path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = _path.with_suffix(_path.suffix + ".tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(_entries, f)
+    os.chmod(tmp, 0o600)
+    os.replace(tmp, _path)
+
+
+def get(provider: str, account: str) -> str | None:
+    """Cached access token, or None if missing or about to expire."""
+    with _lock:
+        entry = _entries.get(_key(provider, account))
+        if entry is None or entry["expires_at"] - EXPIRY_SKEW <= time.time():
+            return None
+        return entry["access_token"]
+
+
+def get_extra(provider: str, account: str, field: str) -> Any:
+    """Additional field stored with a token (e.g. a rotated refresh token), even if expired."""
+    with _lock:
+        return (_entries.get(_key(provider, account)) or {}).get(field)
+
+
+def put(provider: str, account: str, access_token: str, expires_in: float, **extra: Any) -> None:
+    with _lock:
+        key = _key(provider, account)
+        _entries[key] = {
+            **_entries.get(key, {}),
+            **extra,
+            "access_token": access_token,
+            "expires_at": time.time() + float(expires_in),
+        }
+        _save()
+
+
+def invalidate(provider: str, account: str) -> None:
+    """Drop the access token (e.g. after a 401) but keep extra fields like refresh tokens."""
+    with _lock:
+        entry = _entries.get(_key(provider, account))
+        if entry is not None:
+            entry["expires_at"] = 0
+            _save()
+
+
+def get_or_refresh(provider: str, account: str, refresh: Callable[[], tuple[Any, ...]]) -> str:
+    """Return a valid token, calling `refresh() -> (access_token, expires_in[, extra])` when needed.
+
+    `extra` is an optional dict stored alongside the token (see `get_extra`).
+    A per-key lock is held during the refresh so concurrent callers share one token call.
+    """
+    token = get(provider, account)
+    if token is not None:
+        return token
+    with _lock:
+        refresh_lock = _refresh_locks.setdefault(_key(provider, account), threading.Lock())
+    with refresh_lock:
+        token = get(provider, account)
+        if token is None:
+            token, expires_in, *rest = refresh()
+            put(provider, account, token, expires_in, **(rest[0] if rest else {}))
+        return token
+
+
+async def aget_or_refresh(
+    provider: str, account: str, refresh: Callable[[], Awaitable[tuple[Any, ...]]]
+) -> str:
+    """asyncio variant of `get_or_refresh`: concurrent coroutines of one event loop
+    share a single token call per (provider, account)."""
+    token = get(provider, account)
+    if token is not None:
+        return token
+    locks = _async_refresh_locks.setdefault(asyncio.get_running_loop(), {})
+    refresh_lock = locks.setdefault(_key(provider, account), asyncio.Lock())
+    async with refresh_lock:
+        token = get(provider, account)
+        if token is None:
+            token, expires_in, *rest = await refresh()
+            put(provider, account, token, expires_in, **(rest[0] if rest else {}))
+        return token
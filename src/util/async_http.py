@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any
+from urllib.parse import urlsplit
+
+import httpx
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
+
+
+def is_unauthorized(exc: BaseException) -> bool:
+    return isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code == 401
+
+
+def _retryable(exc: BaseException) -> bool:
+    # a 401 is answered by refreshing the token, not by retrying with the same one
+    return not is_unauthorized(exc)
+
+
+class AsyncHttp:
+    """Shared asyncio HTTP client for the REST fetchers.
+
+    One `httpx.AsyncClient` per run with a semaphore per host, so a single event loop
+    can keep many paginated requests in flight without overloading any one API.
+    Use as ``async with AsyncHttp() as http: ...``.
+    """
+
+    def __init__(self, per_host: int = 8, timeout: float = 45.0, pool_size: int = 10):
+        self.per_host = per_host
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._client: httpx.AsyncClient | None = None
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+
+    async def __aenter__(self) -> AsyncHttp:
+        limits = httpx.Limits(
+            max_connections=None, max_keepalive_connections=self.pool_size, keepalive_expiry=60
+        )
+        self._client = httpx.AsyncClient(timeout=self.timeout, limits=limits)
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        sem = self._semaphores.get(host)
+        if sem is None:
+            sem = self._semaphores[host] = asyncio.Semaphore(self.per_host)
+        return sem
+
+    # same policy as the blocking fetchers' tenacity decorators
+    @retry(
+        retry=retry_if_exception(_retryable),
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(min=1, max=8),
+    )
+    async def request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        if self._client is None:
+            raise RuntimeError("AsyncHttp must be used as an async context manager")
+        async with self._semaphore(url):
+            r = await self._client.request(method, url, **kwargs)
+        r.raise_for_status()
+        return r
+
+    async def get_json(self, url: str, **kwargs: Any) -> Any:
+        return (await self.request("GET", url, **kwargs)).json()
+
+    async def post_json(self, url: str, **kwargs: Any) -> Any:
+        return (await self.request("POST", url, **kwargs)).json()
@@ -8,3 +8,12 @@ def berlin_bounds_for_date(d: dt.date) -> tuple[dt.datetime, dt.datetime]:
     start = dt.datetime(d.year, d.month, d.day, 0, 0, 0)
     end = start + dt.timedelta(days=1)
     return start, end
+
+
+def berlin_bounds_for_range(first: dt.date, last: dt.date) -> tuple[dt.datetime, dt.datetime]:
+    # [start of first day, end of last day) with the same boundaries as berlin_bounds_for_date
+    return berlin_bounds_for_date(first)[0], berlin_bounds_for_date(last)[1]
+
+
+def dates_in_range(first: dt.date, last: dt.date) -> list[dt.date]:
+    return [first + dt.timedelta(days=i) for i in range((last - first).days + 1)]
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_lock = threading.Lock()
+_sessions: dict[str, requests.Session] = {}
+_pool_size = 10
+
+
+def configure(pool_size: int) -> None:
+    """Set the per-host connection pool size for sessions created from now on."""
+    global _pool_size
+    _pool_size = max(1, pool_size)
+
+
+def session_for(url: str) -> requests.Session:
+    """Return the shared keep-alive session for the scheme+host of `url`.
+
+    Sessions live until `close_all`, so paginated calls reuse their TCP/TLS connections
+    instead of opening a new one per request.
+    """
+    parts = urlsplit(url)
+    key = f"{parts.scheme}://{parts.netloc}"
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=_pool_size)
+            session.mount(key, adapter)
+            session.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+            _sessions[key] = session
+        return session
+
+
+def is_unauthorized(exc: BaseException) -> bool:
+    response = getattr(exc, "response", None)
+    return (
+        isinstance(exc, requests.HTTPError) and response is not None and response.status_code == 401
+    )
+
+
+def retryable(exc: BaseException) -> bool:
+    """tenacity predicate: retry everything except a 401, which needs a fresh token instead."""
+    return not is_unauthorized(exc)
+
+
+def close_all() -> None:
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import threading
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from itertools import zip_longest
+from typing import Any, TypeVar
+
+T = TypeVar("T")
+
+
+def run_bounded(
+    tasks: list[tuple[str, Callable[[], T]]],
+    max_workers: int,
+    limits: dict[str, int] | None = None,
+) -> list[T | BaseException]:
+    """Run (group, fn) tasks in a thread pool, at most `limits[group]` per group at a time.
+
+    Results come back in task order; a task that raises yields its exception instead
+    of aborting the others.
+    """
+    if not tasks:
+        return []
+    limits = limits or {}
+    semaphores = {
+        group: threading.BoundedSemaphore(max(1, limits[group]))
+        for group, _ in tasks
+        if group in limits
+    }
+
+    def _run(group: str, fn: Callable[[], T]) -> T | BaseException:
+        sem = semaphores.get(group)
+        try:
+            if sem is None:
+                return fn()
+            with sem:
+                return fn()
+        except Exception as e:
+            return e
+
+    # Submit groups round-robin so one throttled group does not occupy every worker
+    by_group: dict[str, list[int]] = {}
+    for i, (group, _) in enumerate(tasks):
+        by_group.setdefault(group, []).append(i)
+    order = [i for batch in zip_longest(*by_group.values()) for i in batch if i is not None]
+
+    results: list[Any] = [None] * len(tasks)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tasks)))) as pool:
+        futures = {i: pool.submit(_run, *tasks[i]) for i in order}
+        for i, fut in futures.items():
+            results[i] = fut.result()
+    return results
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections.abc import Hashable
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, up to `burst` banked."""
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> None:
+        """Take one token, sleeping until it is available.
+
+        The token is reserved under the lock (the balance may go negative), so
+        concurrent callers queue up behind each other instead of all waking at once.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+
+    def set_rate(self, rate: float) -> None:
+        # e.g. from a rate-limit header reported by the API
+        if rate <= 0:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+
+    def drain(self) -> None:
+        """Empty the bucket after a throttled call so the next `acquire` waits a full refill."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, 0.0)
+
+
+class RateScheduler:
+    """Registry of token buckets, one per key (e.g. account, region, operation)."""
+
+    def __init__(self) -> None:
+        self._buckets: dict[Hashable, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, key: Hashable, rate: float, burst: float) -> TokenBucket:
+        """Bucket for `key`, created with the seed `rate`/`burst` on first use."""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(rate, burst)
+            return bucket
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import logging
+import random
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from typing import Any, TypeVar
+
+from gspread.exceptions import APIError
+
+T = TypeVar("T")
+
+# Sheets API: 60 requests per minute per user (read and write quotas are separate,
+# counting both against one budget keeps us on the safe side)
+WINDOW_SECONDS = 60.0
+# truncated exponential backoff on 429 as recommended by Google: min(2^n + jitter, cap)
+MAX_RETRIES = 6
+MAX_BACKOFF = 64.0
+
+log = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_budget = 60
+# start times of the requests in the current window (may lie in the future: reserved slots)
+_sent: deque[float] = deque()
+_stats = {"requests": 0, "retries": 0, "waited_seconds": 0.0}
+
+
+def configure(requests_per_minute: int) -> None:
+    """Set the request budget per sliding minute and reset the counters."""
+    global _budget
+    with _lock:
+        _budget = max(1, requests_per_minute)
+        _sent.clear()
+        _stats.update(requests=0, retries=0, waited_seconds=0.0)
+
+
+def stats() -> dict[str, float]:
+    """Requests made, 429 retries and seconds spent waiting since `configure`."""
+    with _lock:
+        return dict(_stats)
+
+
+def _reserve() -> float:
+    # claim the next free slot in the window; returns how long to wait for it
+    with _lock:
+        now = time.monotonic()
+        while _sent and _sent[0] <= now - WINDOW_SECONDS:
+            _sent.popleft()
+        start = now
+        if len(_sent) >= _budget:
+            start = _sent[-_budget] + WINDOW_SECONDS
+        _sent.append(start)
+        _stats["requests"] += 1
+        wait = start - now
+        _stats["waited_seconds"] += wait
+        return wait
+
+
+def _is_rate_limited(exc: APIError) -> bool:
+    response = getattr(exc, "response", None)
+    return response is not None and response.status_code == 429
+
+
+def call(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run one Sheets API call within the budget, retrying with backoff on 429."""
+    attempt = 0
+    while True:
+        wait = _reserve()
+        if wait > 0:
+            time.sleep(wait)
+        try:
+            return fn(*args, **kwargs)
+        except APIError as e:
+            if not _is_rate_limited(e) or attempt >= MAX_RETRIES:
+                raise
+        backoff = min(2**attempt + random.uniform(0, 1), MAX_BACKOFF)
+        log.warning("Sheets-Kontingent erschöpft (429), neuer Versuch in %.1f s", backoff)
+        with _lock:
+            _stats["retries"] += 1
+            _stats["waited_seconds"] += backoff
+        time.sleep(backoff)
+        attempt += 1